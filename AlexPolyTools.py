@@ -1,4 +1,6 @@
-from sympy import symbols, Matrix, expand
+from sympy import symbols, Matrix, expand, Rational
+from fractions import Fraction
+import numpy as np
 
 # printing method adapted from
 # https://stackoverflow.com/questions/13214809/pretty-print-2d-python-list
@@ -49,6 +51,128 @@ def compute(ijkCrossings, handedness):
     return expand(matrix.det())
 
 
+# the alexander matrix evaluated at an integer t, as a numpy object array of
+# python ints (last row and column already removed)
+def getIntegerMatrix(ijkCrossings, handedness, tVal):
+    n = len(ijkCrossings)
+    A = np.zeros((n, n), dtype=object)
+    for crossingNum in range(n):
+        row = A[crossingNum]
+        i = ijkCrossings[crossingNum]["i"]
+        j = ijkCrossings[crossingNum]["j"]
+        k = ijkCrossings[crossingNum]["k"]
+
+        # same entries (and overwrite order) as getMatrix
+        row[i] = 1 - tVal
+        if handedness[crossingNum] == "right":
+            row[j] = -1
+            row[k] = tVal
+        elif handedness[crossingNum] == "left":
+            row[j] = tVal
+            row[k] = -1
+        else:
+            raise ValueError("Unrecognized handedness: {}".format(handedness[crossingNum]))
+    return A[:n-1, :n-1]
+
+
+# exact determinant of an integer matrix with fraction-free (Bareiss)
+# elimination, every division along the way is exact
+def bareissDet(M):
+    M = M.copy()
+    n = M.shape[0]
+    if n == 0:
+        return 1
+    sign = 1
+    prev = 1
+    for k in range(n - 1):
+        # find a nonzero pivot
+        if M[k, k] == 0:
+            nonzero = [r for r in range(k + 1, n) if M[r, k] != 0]
+            if not nonzero:
+                return 0
+            M[[k, nonzero[0]]] = M[[nonzero[0], k]]
+            sign = -sign
+        M[k+1:, k+1:] = (
+            M[k+1:, k+1:] * M[k, k] - np.outer(M[k+1:, k], M[k, k+1:])
+        ) // prev
+        prev = M[k, k]
+    return sign * M[n-1, n-1]
+
+
+# points to evaluate at, kept close to 0 so the determinants stay small
+def getSamplePoints(numPoints):
+    points = [0]
+    step = 1
+    while len(points) < numPoints:
+        points.append(step)
+        if len(points) < numPoints:
+            points.append(-step)
+        step += 1
+    return points
+
+
+# integer coefficients (lowest power first) of the polynomial of degree
+# < len(xs) through the given points, by newton's divided differences
+def interpolate(xs, ys):
+    n = len(xs)
+    divided = [Fraction(y) for y in ys]
+    for level in range(1, n):
+        for i in range(n - 1, level - 1, -1):
+            divided[i] = (divided[i] - divided[i - 1]) / (xs[i] - xs[i - level])
+
+    # expand the newton form back into plain coefficients
+    coeffs = [Fraction(0)] * n
+    for i in range(n - 1, -1, -1):
+        # coeffs = coeffs * (t - xs[i]) + divided[i]
+        shifted = [Fraction(0)] + coeffs[:-1]
+        coeffs = [shifted[d] - xs[i] * coeffs[d] for d in range(n)]
+        coeffs[0] += divided[i]
+    if any(c.denominator != 1 for c in coeffs):
+        raise ValueError("Alexander polynomial didn't interpolate to integers")
+    return [int(c) for c in coeffs]
+
+
+# shift a coefficient list so it's symmetric about t^0 and fix its sign
+# (delta(1) = 1 for knots, positive leading coefficient otherwise).
+# returns {power of t: coefficient}, powers can be halves for links
+def normalize(coeffs):
+    powers = [d for d, c in enumerate(coeffs) if c != 0]
+    if not powers:
+        return dict()
+    low, high = powers[0], powers[-1]
+    shift = Fraction(low + high, 2)
+    total = sum(coeffs)
+    sign = 1 if total > 0 or (total == 0 and coeffs[high] > 0) else -1
+    return {d - shift: sign * coeffs[d] for d in powers}
+
+
+# alexander polynomial without symbolic determinants: take exact integer
+# determinants at enough values of t and interpolate. returns a symmetric
+# sympy expression in t
+def computeFast(ijkCrossings, handedness):
+    n = len(ijkCrossings)
+    t = symbols('t')
+    if n <= 1:
+        return 1 + 0*t
+
+    # entries are linear in t, so the determinant has degree at most n - 1
+    points = getSamplePoints(n)
+    values = [
+        bareissDet(getIntegerMatrix(ijkCrossings, handedness, tVal))
+        for tVal in points
+    ]
+    normalized = normalize(interpolate(points, values))
+    return sum(
+        [c * t**Rational(d.numerator, d.denominator) for d, c in normalized.items()],
+        0
+    )
+
+
+# computeFast over many knots, each given as (ijkCrossings, handedness)
+def computeBatch(knots):
+    return [computeFast(ijkCrossings, handedness) for ijkCrossings, handedness in knots]
+
+
 if __name__ == "__main__":
     from KnotCanvas import main
     main()
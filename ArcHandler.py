@@ -1,5 +1,6 @@
 from colour import Color
 import ImageTools as itools
+import numpy as np
 import json
 from random import sample
 
@@ -15,15 +16,121 @@ POINTS_FOR_LINREG = 5
 # handedness of crossing
 I_LINE_LEN = 10
 
+# dict-like view of an int32 label image: maps (col, row) pixels to their
+# label, -1 meaning the pixel isn't in the map
+class PixelLabelMap:
+    def __init__(self, labels):
+        self.labels = labels
+
+    def _inBounds(self, pixel):
+        return 0 <= pixel[1] < self.labels.shape[0] and 0 <= pixel[0] < self.labels.shape[1]
+
+    def __contains__(self, pixel):
+        return self._inBounds(pixel) and self.labels[pixel[1], pixel[0]] >= 0
+
+    def __getitem__(self, pixel):
+        if pixel not in self:
+            raise KeyError(pixel)
+        return int(self.labels[pixel[1], pixel[0]])
+
+    def __setitem__(self, pixel, label):
+        self.labels[pixel[1], pixel[0]] = label
+
+    def __delitem__(self, pixel):
+        if pixel not in self:
+            raise KeyError(pixel)
+        self.labels[pixel[1], pixel[0]] = -1
+
+    def __len__(self):
+        return int(np.count_nonzero(self.labels >= 0))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, pixel, default=None):
+        return self[pixel] if pixel in self else default
+
+    # pixels in row by row order
+    def keys(self):
+        rows, cols = np.nonzero(self.labels >= 0)
+        return list(zip(cols.tolist(), rows.tolist()))
+
+    def items(self):
+        rows, cols = np.nonzero(self.labels >= 0)
+        return list(zip(zip(cols.tolist(), rows.tolist()), self.labels[rows, cols].tolist()))
+
+    def update(self, pairs):
+        for pixel, label in pairs:
+            self[pixel] = label
+
+
+# set-like view of all pixels of a label image that have a given label (and
+# are set in mask, if given)
+class PixelLabelSet:
+    def __init__(self, labels, label, mask=None):
+        self.labels = labels
+        self.label = label
+        self.mask = mask
+
+    def _members(self):
+        members = self.labels == self.label
+        if self.mask is not None:
+            members &= self.mask
+        return members
+
+    def __contains__(self, pixel):
+        row, col = pixel[1], pixel[0]
+        if not (0 <= row < self.labels.shape[0] and 0 <= col < self.labels.shape[1]):
+            return False
+        if self.mask is not None and not self.mask[row, col]:
+            return False
+        return self.labels[row, col] == self.label
+
+    def add(self, pixel):
+        self.labels[pixel[1], pixel[0]] = self.label
+        if self.mask is not None:
+            self.mask[pixel[1], pixel[0]] = True
+
+    def remove(self, pixel):
+        if pixel not in self:
+            raise KeyError(pixel)
+        if self.mask is not None:
+            self.mask[pixel[1], pixel[0]] = False
+        else:
+            self.labels[pixel[1], pixel[0]] = -1
+
+    def __len__(self):
+        return int(np.count_nonzero(self._members()))
+
+    def __iter__(self):
+        return iter([tuple(p) for p in self.coords().tolist()])
+
+    # (n, 2) array of (col, row) coordinates in row by row order
+    def coords(self):
+        rows, cols = np.nonzero(self._members())
+        return np.stack([cols, rows], axis=1)
+
+
 class ArcHandler:
-    def __init__(self):
+    # give the image shape to keep arc and spine membership in int32 label
+    # images instead of dicts and sets of pixel tuples
+    def __init__(self, imageShape=None):
+        self.imageShape = imageShape
+        if imageShape is None:
+            self.pixelArcs = dict() # pixel to arc
+            self.pixelSpines = dict() # pixel to spine
+        else:
+            self.arcLabels = np.full(imageShape, -1, dtype=np.int32) # arc of each pixel
+            self.spineLabels = np.full(imageShape, -1, dtype=np.int32) # spine of each pixel
+            self.boundaryMask = np.zeros(imageShape, dtype=bool) # boundary pixels
+            self.pixelArcs = PixelLabelMap(self.arcLabels)
+            self.pixelSpines = PixelLabelMap(self.spineLabels)
         self.arcPixels = [] # arcs to pixels (list of sets)
-        self.pixelArcs = dict() # pixel to arc
         self.arcBoundaryPixels = [] # arcs to boundary pixels (list of sets)
         self.arcSpinePixels = [] # arcs to spine pixels (list of sets)
-        self.pixelSpines = dict() # pixel to spine
         self.spineTrees = [] # for each arc, dict maps pixel => {prev => [], next => []}
         self.spineEndPoints = [] # for each arc, list of endpoints
+        self.spinePaths = [] # for each arc, ordered (n, 2) array of spine pixels, or None
         self.snippedSpinePixs = set() # spine pixels that have been snipped off
         self.crossings = [] # arcNum => {endPoint => endPoint (of other arc)}
         self.knotEnumeration = None # spinePixel => {"next": piexl, "prev": pixel}
@@ -249,6 +356,10 @@ class ArcHandler:
 
     # returns a doubly linked list of the entire length of the knot
     def enumerateKnotLength(self):
+        # with ordered spines we can just glue whole arcs together
+        if self.spinePaths and all([path is not None for path in self.spinePaths]):
+            return self._enumerateKnotLengthFromPaths()
+
         # helper function to return next pixel and new direction to travel in
         def nextPixelAndDirKey(currPixel, currDirKey):
             # if no direction, choose one
@@ -310,6 +421,56 @@ class ArcHandler:
         
         self.knotEnumeration = enumeration
     
+    # enumerateKnotLength for ordered spines: walk arc to arc through the
+    # endpoint connections, taking each arc's spine as one slice
+    def _enumerateKnotLengthFromPaths(self):
+        # choose the first spine pixel (in row order)
+        firsts = [path[np.lexsort((path[:, 0], path[:, 1]))[0]] for path in self.spinePaths]
+        source = tuple(min(firsts, key=lambda p: (p[1], p[0])).tolist())
+        sourceArc = self.getPixelArc(source)
+        sourcePath = self.spinePaths[sourceArc]
+        sourceInd = int(np.nonzero((sourcePath == source).all(axis=1))[0][0])
+
+        # head away from the source in the "next" direction if we can
+        forward = sourceInd < len(sourcePath) - 1
+        pieces = [sourcePath[sourceInd:] if forward else sourcePath[sourceInd::-1]]
+        for _ in range(len(self.spinePaths)):
+            epPair = self.getEndPointPair(tuple(pieces[-1][-1].tolist()))
+            if epPair is None:
+                print("Error: Pixel {} didn't have an endpoint partner".format(tuple(pieces[-1][-1])))
+                return
+            arcNum = self.getPixelArc(epPair)
+            path = self.spinePaths[arcNum]
+            enteredAtStart = epPair == tuple(path[0].tolist())
+            if arcNum == sourceArc: # back around to where we started
+                if enteredAtStart != forward:
+                    print("Error: Came back to arc {} from the wrong end".format(arcNum))
+                    return
+                pieces.append(path[:sourceInd] if forward else path[:sourceInd:-1])
+                break
+            pieces.append(path if enteredAtStart else path[::-1])
+        else:
+            print("Error: Never made it back to arc {}".format(sourceArc))
+            return
+
+        pixels = [tuple(p) for p in np.concatenate(pieces).tolist()]
+        enumeration = dict()
+        for ind, pixel in enumerate(pixels):
+            if pixel in enumeration:
+                print("Error: Overriding pixel {} in enumeration".format(pixel))
+                return
+            enumeration[pixel] = {
+                "prev": pixels[ind - 1],
+                "next": pixels[(ind + 1) % len(pixels)]
+            }
+
+        # error check
+        if len(enumeration) != len(self.pixelSpines):
+            print("Error: Enumeration ({}) and pixelSpines ({}) have different lengths".format(
+                len(enumeration), len(self.pixelSpines)))
+
+        self.knotEnumeration = enumeration
+
     # returns true if all spine endpoints have pairs
     def allEndpointsConnected(self):
         allEndPoints = []
@@ -354,11 +515,18 @@ class ArcHandler:
     def forceArcInitialized(self, arcNum):
         i = arcNum
         while i >= len(self.arcPixels): # make sure we've initialized arc
-            self.arcPixels.append(set())
-            self.arcBoundaryPixels.append(set())
-            self.arcSpinePixels.append(set())
+            if self.imageShape is None:
+                self.arcPixels.append(set())
+                self.arcBoundaryPixels.append(set())
+                self.arcSpinePixels.append(set())
+            else: # views into the label images
+                arcNum = len(self.arcPixels)
+                self.arcPixels.append(PixelLabelSet(self.arcLabels, arcNum))
+                self.arcBoundaryPixels.append(PixelLabelSet(self.arcLabels, arcNum, self.boundaryMask))
+                self.arcSpinePixels.append(PixelLabelSet(self.spineLabels, arcNum))
             self.spineTrees.append(dict())
             self.spineEndPoints.append(None)
+            self.spinePaths.append(None)
             self.crossings.append(dict())
 
     # use this to add a pixel to arc or set it as boundary or spine
@@ -379,6 +547,30 @@ class ArcHandler:
         if isSpine:
             self.setPixelAsSpine(pixel)
         
+    # bulk version of addPixelToArc: pixels[i] goes to arcNums[i], and is a
+    # boundary pixel if isBoundary[i]
+    def addPixelsToArcs(self, pixels, arcNums, isBoundary=None):
+        if arcNums:
+            self.forceArcInitialized(max(arcNums))
+        for ind, (pixel, arcNum) in enumerate(zip(pixels, arcNums)):
+            self.arcPixels[arcNum].add(pixel)
+            if isBoundary is not None and isBoundary[ind]:
+                self.arcBoundaryPixels[arcNum].add(pixel)
+        self.pixelArcs.update(zip(pixels, arcNums))
+
+    # add every arc of a label image (0 is background, arc n is labeled n+1)
+    # boundaryMask marks which of the pixels are boundary pixels
+    def addArcsFromLabels(self, labels, numArcs, boundaryMask):
+        self.forceArcInitialized(numArcs - 1)
+        if self.imageShape is None:
+            rows, cols = np.nonzero(labels)
+            arcNums = (labels[rows, cols] - 1).tolist()
+            pixels = list(zip(cols.tolist(), rows.tolist()))
+            self.addPixelsToArcs(pixels, arcNums, boundaryMask[rows, cols].tolist())
+        else:
+            self.arcLabels[...] = labels - 1
+            self.boundaryMask[...] = boundaryMask & (labels > 0)
+
     def setPixelAsBoundary(self, pixel):
         arcNum = self.getPixelArc(pixel)
         if arcNum is None:
@@ -398,6 +590,26 @@ class ArcHandler:
         self.pixelSpines[pixel] = arcNum # pixel => arc
 
 
+    # set an arc's whole spine at once from an ordered (n, 2) array of (col, row)
+    # pixels. the array goes in the "next" direction
+    def setSpinePath(self, arcNum, path):
+        self.forceArcInitialized(arcNum)
+        pixels = [tuple(p) for p in path.tolist()]
+        if self.imageShape is None:
+            self.arcSpinePixels[arcNum].update(pixels)
+            self.pixelSpines.update((pixel, arcNum) for pixel in pixels)
+        else:
+            self.spineLabels[path[:, 1], path[:, 0]] = arcNum
+
+        # link up the tree so everything that walks it still works
+        tree = {pixel: {'prev': [], 'next': []} for pixel in pixels}
+        for pixel, nextPixel in zip(pixels, pixels[1:]):
+            tree[pixel]['next'].append(nextPixel)
+            tree[nextPixel]['prev'].append(pixel)
+        self.spineTrees[arcNum] = tree
+        self.spinePaths[arcNum] = path
+        self.spineEndPoints[arcNum] = [pixels[0], pixels[-1]]
+
     def getPixelSpine(self, pixel):
         return self.pixelArcs[pixel]
 
@@ -574,6 +786,8 @@ class ArcHandler:
 
     # retusns the spine joints of a given arcNum
     def getSpineJoints(self, arcNum):
+        if self.spinePaths[arcNum] is not None: # ordered spines are single lines
+            return []
         spinePixels = self.getArcPixels(arcNum, spine=True)
         return [p for p in spinePixels
             if len(self._getSpineNeighbors(p, 'prev') + self._getSpineNeighbors(p, 'next')) > 2]
@@ -585,6 +799,12 @@ class ArcHandler:
         # heads = [p for p in endPoints if self._getSpineNeighbors(p, 'next')]
         joints = self.getSpineJoints(arcNum)
 
+        if self.spinePaths[arcNum] is not None: # already ordered head to tail
+            line = [tuple(p) for p in self.spinePaths[arcNum].tolist()]
+            red = Color("red")
+            colors = list(red.range_to(Color("blue"), len(line)))
+            scaledRgbs = [(r*255, g*255, b*255) for (r, g, b) in [color.rgb for color in colors]]
+            return line, scaledRgbs
 
         if len(joints) == 0:
             # choose source endpoint arbitrarily
@@ -905,6 +1125,13 @@ class ArcHandler:
         else:
             return self.arcPixels[arcNum]
 
+    # returns an (n, 2) numpy array of the (col, row) coordinates of an arc
+    def getArcCoords(self, arcNum, boundary=False, spine=False):
+        pixels = self.getArcPixels(arcNum, boundary, spine)
+        if isinstance(pixels, PixelLabelSet):
+            return pixels.coords()
+        return np.array(sorted(pixels, key=lambda p: (p[1], p[0])), dtype=np.int64).reshape(-1, 2)
+
     def getPixelMappings(self):
         return self.pixelArcs
 
@@ -940,6 +1167,19 @@ class ArcHandler:
         # keep track of both paths to return
         paths = []
 
+        # ordered spines: the linreg points are just a slice off either end
+        spinePath = self.spinePaths[arcNum]
+        if spinePath is not None:
+            for ep in spineEndPoints:
+                if ep == tuple(spinePath[-1].tolist()): # forward end
+                    epLinRegPoints = spinePath[-(POINTS_TO_CUT + POINTS_FOR_LINREG):-POINTS_TO_CUT]
+                else:
+                    epLinRegPoints = spinePath[POINTS_TO_CUT:POINTS_TO_CUT + POINTS_FOR_LINREG][::-1]
+                epLinRegPoints = [tuple(p) for p in epLinRegPoints.tolist()]
+                path, r2 = itools.interpolateToPath(epLinRegPoints, n, ep)
+                paths.append(path)
+            return paths
+
         for ep in spineEndPoints: # for each end point
             # get which endpoint this is
             forwardEnd = len(self.getNextSpinePixels(ep)) == 0
@@ -0,0 +1,321 @@
+from LaurentPoly import LaurentPoly
+
+# HOMFLY through braids: turn a knot diagram into a closed braid with Vogel's
+# algorithm, then take the trace of that braid in the Hecke algebra.
+#
+# diagrams are the same i0/i1/j/k crossings and 'left'/'right' handedness as in
+# Knot. 'right' crossings are the positive ones (the P+ of Knot's skein)
+
+# counterclockwise order of a crossing's dirs around it
+ROTATIONS = {
+    'right': ['i1', 'k', 'i0', 'j'],
+    'left': ['i1', 'j', 'i0', 'k']
+}
+
+# give up on a diagram that needs more Vogel moves than this per crossing
+MAX_VOGEL_MOVES = 50
+
+
+# drop removed crossings and return copies we're free to modify
+def compress(ijkCrossings, handedness):
+    crossings = [dict(cData.items()) for cData in ijkCrossings if cData is not None]
+    hands = [hand for cData, hand in zip(ijkCrossings, handedness) if cData is not None]
+    return crossings, hands
+
+
+# arc => ((tail crossing, tail dir), (head crossing, head dir))
+def getArcEnds(crossings):
+    tails, heads = dict(), dict()
+    for c, cData in enumerate(crossings):
+        for myDir, arc in cData.items():
+            if myDir in ['i1', 'k']:
+                tails[arc] = (c, myDir)
+            else:
+                heads[arc] = (c, myDir)
+    return {arc: (tails[arc], heads[arc]) for arc in tails}
+
+
+# the arc that follows a given arc once every crossing is smoothed
+def nextSeifertArc(crossings, arcEnds, arc):
+    c, myDir = arcEnds[arc][1]
+    return crossings[c]['k' if myDir == 'i0' else 'i1']
+
+
+# arc => index of the Seifert circle it lies on, and the number of circles
+def getSeifertCircles(crossings, arcEnds):
+    circles = dict()
+    numCircles = 0
+    for startArc in arcEnds:
+        if startArc in circles:
+            continue
+        arc = startArc
+        while arc not in circles:
+            circles[arc] = numCircles
+            arc = nextSeifertArc(crossings, arcEnds, arc)
+        numCircles += 1
+    return circles, numCircles
+
+
+# all faces of the diagram, each a list of (arc, forward) darts walked with the
+# face on their left. forward darts run along the arc's orientation
+def getFaces(crossings, hands, arcEnds):
+    faces = []
+    seen = set()
+    for arc in arcEnds:
+        for forward in [True, False]:
+            if (arc, forward) in seen:
+                continue
+            face = []
+            dart = (arc, forward)
+            while dart not in seen:
+                seen.add(dart)
+                face.append(dart)
+
+                # arrive at a crossing and turn to the next dir clockwise
+                c, myDir = arcEnds[dart[0]][1 if dart[1] else 0]
+                rotation = ROTATIONS[hands[c]]
+                nextDir = rotation[(rotation.index(myDir) - 1) % 4]
+                dart = (crossings[c][nextDir], nextDir in ['i1', 'k'])
+            faces.append(face)
+    return faces
+
+
+# return crossings split into groups that share no arcs
+def getPieces(crossings):
+    arcCrossings = dict()
+    for c, cData in enumerate(crossings):
+        for arc in cData.values():
+            arcCrossings.setdefault(arc, []).append(c)
+    pieces = []
+    seen = set()
+    for start in range(len(crossings)):
+        if start in seen:
+            continue
+        piece = []
+        stack = [start]
+        seen.add(start)
+        while stack:
+            c = stack.pop()
+            piece.append(c)
+            for arc in crossings[c].values():
+                for n in arcCrossings[arc]:
+                    if n not in seen:
+                        seen.add(n)
+                        stack.append(n)
+        pieces.append(sorted(piece))
+    return pieces
+
+
+# return a face's first pair of darts that lie on different Seifert circles
+# but have the face on the same side, or None if the face has no such pair
+def getIncompatiblePair(face, circles):
+    firstOnSide = {True: dict(), False: dict()} # side => circle => dart
+    for dart in face:
+        onSide = firstOnSide[dart[1]]
+        circle = circles[dart[0]]
+        for otherCircle, otherDart in onSide.items():
+            if otherCircle != circle:
+                return otherDart, dart
+        if circle not in onSide:
+            onSide[circle] = dart
+    return None
+
+
+# push arc a over arc b through the face they share (a Reidemeister 2 move),
+# adding two crossings. forward says which side of both arcs the face is on
+def vogelMove(crossings, hands, arcEnds, a, b, forward):
+    nextArc = max(arcEnds) + 1
+    aMid, aEnd, bMid, bEnd = range(nextArc, nextArc + 4)
+
+    # the back halves of a and b get new arcs
+    aHead, aHeadDir = arcEnds[a][1]
+    bHead, bHeadDir = arcEnds[b][1]
+    crossings[aHead][aHeadDir] = aEnd
+    crossings[bHead][bHeadDir] = bEnd
+
+    # a meets x then y, b meets y then x
+    crossings.append({'i0': a, 'i1': aMid, 'j': bMid, 'k': bEnd}) # x
+    crossings.append({'i0': aMid, 'i1': aEnd, 'j': b, 'k': bMid}) # y
+    hands.append('right' if forward else 'left')
+    hands.append('left' if forward else 'right')
+
+
+# turn a connected diagram into a closed braid. returns the number of strands
+# and the braid word as a list of (generator, is positive), generators from 0
+def getBraid(crossings, hands):
+    crossings, hands = [dict(cData) for cData in crossings], list(hands)
+
+    # make sure the handedness gives a planar diagram
+    arcEnds = getArcEnds(crossings)
+    if len(getFaces(crossings, hands, arcEnds)) != len(crossings) + 2:
+        raise ValueError("Diagram isn't planar with the given handedness")
+
+    # Vogel moves until every face is compatible
+    maxMoves = MAX_VOGEL_MOVES * len(crossings)
+    for _ in range(maxMoves + 1):
+        circles, numCircles = getSeifertCircles(crossings, arcEnds)
+        pair = None
+        for face in getFaces(crossings, hands, arcEnds):
+            pair = getIncompatiblePair(face, circles)
+            if pair is not None:
+                break
+        if pair is None:
+            break
+        (a, forward), (b, _) = pair
+        vogelMove(crossings, hands, arcEnds, a, b, forward)
+        arcEnds = getArcEnds(crossings)
+    else:
+        raise ValueError("Vogel's algorithm didn't finish in {} moves".format(maxMoves))
+
+    # the Seifert circles are now nested, find their order from the crossings
+    neighbors = [set() for _ in range(numCircles)]
+    crossingCircles = []
+    for cData in crossings:
+        c1, c2 = circles[cData['i0']], circles[cData['j']]
+        neighbors[c1].add(c2)
+        neighbors[c2].add(c1)
+        crossingCircles.append((c1, c2))
+    ends = [circle for circle in range(numCircles) if len(neighbors[circle]) <= 1]
+    order = [ends[0]]
+    while len(order) < numCircles:
+        nexts = [n for n in neighbors[order[-1]] if n not in order]
+        if len(nexts) != 1:
+            raise ValueError("Seifert circles aren't nested in a line")
+        order.append(nexts[0])
+    position = {circle: p for p, circle in enumerate(order)}
+
+    # crossings in the order each circle passes them
+    passes = [[] for _ in range(numCircles)]
+    for circle in order:
+        startArc = min(arc for arc in circles if circles[arc] == circle)
+        arc = startArc
+        while True:
+            passes[position[circle]].append(arcEnds[arc][1][0])
+            arc = nextSeifertArc(crossings, arcEnds, arc)
+            if arc == startArc:
+                break
+
+    # cut every circle along one ray out from the braid axis: start the next
+    # circle just before the first crossing it shares with this one
+    for p in range(numCircles - 1):
+        shared = [c for c in passes[p] if position[circles[crossings[c]['i0']]] + position[circles[crossings[c]['j']]] == 2 * p + 1]
+        start = passes[p + 1].index(shared[0])
+        passes[p + 1] = passes[p + 1][start:] + passes[p + 1][:start]
+
+    # sweep around the axis, a crossing is next once it's next on both circles
+    word = []
+    pointers = [0] * numCircles
+    for _ in range(len(crossings)):
+        for p in range(numCircles - 1):
+            if pointers[p] < len(passes[p]) and pointers[p + 1] < len(passes[p + 1]):
+                c = passes[p][pointers[p]]
+                if passes[p + 1][pointers[p + 1]] == c:
+                    word.append((p, hands[c] == 'right'))
+                    pointers[p] += 1
+                    pointers[p + 1] += 1
+                    break
+        else:
+            raise ValueError("Couldn't read a braid word off the diagram")
+
+    return numCircles, word
+
+
+# Hecke algebra in generators g with g^2 = a*g + b, where a = -m/l, b = -l^-2
+# so that l*g + l^-1*g^-1 + m = 0 matches Knot's skein relation. elements are
+# {permutation: coefficient} over the standard basis
+class HeckeAlgebra:
+    def __init__(self, l, m):
+        self.a = -m / l
+        self.b = -l**-2
+        self.bInv = -l**2
+        self.delta = -(l + l**-1) / m # value of a split unknot
+        self.one = LaurentPoly.monomial(1)
+        self.traces = dict() # permutation => trace of its basis element
+
+    # multiply an element on the right by g_i or its inverse
+    def mulGenerator(self, elem, i, positive=True):
+        result = dict()
+
+        def add(perm, coeff):
+            total = result.get(perm, 0) + coeff
+            if total:
+                result[perm] = total
+            elif perm in result:
+                del result[perm]
+
+        for perm, coeff in elem.items():
+            swapped = perm[:i] + (perm[i + 1], perm[i]) + perm[i + 2:]
+            longer = perm[i] < perm[i + 1]
+            if positive:
+                if longer: # T_w g = T_ws
+                    add(swapped, coeff)
+                else: # T_w g = a T_w + b T_ws
+                    add(perm, coeff * self.a)
+                    add(swapped, coeff * self.b)
+            else: # g^-1 = b^-1 (g - a)
+                if longer: # T_w g^-1 = b^-1 T_ws - a b^-1 T_w
+                    add(swapped, coeff * self.bInv)
+                    add(perm, -coeff * self.a * self.bInv)
+                else: # T_w g^-1 = T_ws
+                    add(swapped, coeff)
+        return result
+
+    # Ocneanu style trace with tr(x g_n) = tr(x) and tr(x) = delta tr(x) when
+    # x gains an unused strand, so the trace of a braid is its closure's HOMFLY
+    def traceBasis(self, perm):
+        if perm in self.traces:
+            return self.traces[perm]
+        n = len(perm)
+        if n <= 1:
+            trace = self.one
+        elif perm[-1] == n - 1: # last strand unused
+            trace = self.delta * self.traceBasis(perm[:-1])
+        else:
+            # perm = u s_{n-2} s_{n-3} ... s_k with u on the first n-1 strands,
+            # the trace drops s_{n-2} and leaves u s_{n-3} ... s_k
+            k = perm.index(n - 1)
+            u = perm[:k] + perm[k + 1:]
+            elem = {u: self.one}
+            for i in range(n - 3, k - 1, -1):
+                elem = self.mulGenerator(elem, i)
+            trace = self.trace(elem)
+        self.traces[perm] = trace
+        return trace
+
+    def trace(self, elem):
+        total = LaurentPoly()
+        for perm, coeff in elem.items():
+            total = total + coeff * self.traceBasis(perm)
+        return total
+
+
+# HOMFLY of a closed braid on numStrands strands
+def braidHomfly(numStrands, word, l, m, algebra=None):
+    if algebra is None:
+        algebra = HeckeAlgebra(l, m)
+    elem = {tuple(range(numStrands)): algebra.one}
+    for generator, positive in word:
+        elem = algebra.mulGenerator(elem, generator, positive)
+    return algebra.trace(elem)
+
+
+# HOMFLY of a diagram (removed crossings are skipped) plus some unknots, as a
+# LaurentPoly in l and m. each piece's braid word is reported to tracer (a
+# SkeinTracer) if there is one
+def computeHomfly(ijkCrossings, handedness, numUnknots, l, m, tracer=None):
+    crossings, hands = compress(ijkCrossings, handedness)
+    algebra = HeckeAlgebra(l, m)
+
+    # a split diagram is the product of its pieces, with a delta per split
+    poly = algebra.one
+    pieces = getPieces(crossings)
+    for piece in pieces:
+        numStrands, word = getBraid(
+            [crossings[c] for c in piece], [hands[c] for c in piece]
+        )
+        if tracer:
+            tracer.event("braid", strands=numStrands, word=[
+                (generator + 1) * (1 if positive else -1) for generator, positive in word
+            ])
+        poly = poly * braidHomfly(numStrands, word, l, m, algebra)
+    return poly * algebra.delta**(len(pieces) + numUnknots - 1)
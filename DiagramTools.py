@@ -0,0 +1,216 @@
+import random
+
+# build knot diagrams without an image: torus knots, twist knots, pretzel
+# links, closed braids (random or given) and PD codes. every generator returns
+# (ijkCrossings, handedness, numUnknots) in the i0/i1/j/k form Knot takes, so
+# Knot(*diagram) gives a knot to work with.
+#
+# crossings are put together from four slots each, counterclockwise from the
+# top right. strands run between opposite slots and the under strand is
+# either the NW-SE or the NE-SW diagonal. once everything is connected the
+# strands are walked to orient them and number the arcs
+
+NE, NW, SW, SE = range(4)
+
+# give up looking for a random braid that closes up to a knot after this many
+MAX_RANDOM_TRIES = 1000
+
+
+# crossings and the connections between their slots, turned into a diagram
+# by build()
+class DiagramBuilder:
+    def __init__(self):
+        self.underNWSE = [] # crossing => whether its under strand runs NW-SE
+        self.links = dict() # (crossing, slot) => (crossing, slot) it's joined to
+        self.numUnknots = 0
+
+    def addCrossing(self, underNWSE):
+        self.underNWSE.append(underNWSE)
+        return len(self.underNWSE) - 1
+
+    # join two slots with an arc
+    def connect(self, a, b):
+        if a in self.links or b in self.links:
+            raise ValueError("Slot {} or {} is already connected".format(a, b))
+        self.links[a] = b
+        self.links[b] = a
+
+    # orient every component by walking it, entering at the first unvisited
+    # slot of `starts` (then any slot), and return the diagram
+    def build(self, starts=()):
+        n = len(self.underNWSE)
+        if len(self.links) != 4 * n:
+            raise ValueError("{} of {} slots aren't connected".format(4 * n - len(self.links), 4 * n))
+
+        arcs = dict() # (crossing, slot) => (arc, whether the arc comes in there)
+        nextArc = 0
+        allSlots = [(c, slot) for c in range(n) for slot in range(4)]
+        for start in list(starts) + allSlots:
+            if start in arcs:
+                continue
+
+            # (in slot, out slot) at each crossing along the component
+            passes = []
+            inSlot = start
+            while inSlot not in arcs:
+                outSlot = (inSlot[0], (inSlot[1] + 2) % 4)
+                arcs[inSlot] = arcs[outSlot] = None
+                passes.append((inSlot, outSlot))
+                inSlot = self.links[outSlot]
+
+            # the arc leaving each pass enters the next one
+            for p, (inSlot, outSlot) in enumerate(passes):
+                arcs[outSlot] = (nextArc + p, False)
+                arcs[passes[(p + 1) % len(passes)][0]] = (nextArc + p, True)
+            nextArc += len(passes)
+
+        ijkCrossings, handedness = [], []
+        for c in range(n):
+            underSlots = [NW, SE] if self.underNWSE[c] else [NE, SW]
+            overSlots = [NE, SW] if self.underNWSE[c] else [NW, SE]
+            underIn = [slot for slot in underSlots if arcs[(c, slot)][1]][0]
+            overIn = [slot for slot in overSlots if arcs[(c, slot)][1]][0]
+            ijkCrossings.append({
+                'i0': arcs[(c, overIn)][0],
+                'i1': arcs[(c, (overIn + 2) % 4)][0],
+                'j': arcs[(c, underIn)][0],
+                'k': arcs[(c, (underIn + 2) % 4)][0],
+            })
+            # counterclockwise from the under strand coming in, a right
+            # crossing has the over strand coming in last (see BraidTools)
+            handedness.append('right' if overIn == (underIn + 3) % 4 else 'left')
+        return ijkCrossings, handedness, self.numUnknots
+
+
+# the closure of a braid word. generator g > 0 is sigma_g, where the strand in
+# position g - 1 (from the left, counting from 0) passes under the one in
+# position g, and is a right crossing. g < 0 is its inverse. strands run down
+# and each is closed up round the right
+def fromBraid(word, numStrands=None):
+    if numStrands is None:
+        numStrands = max([abs(g) for g in word], default=0) + 1
+    builder = DiagramBuilder()
+    first = [None] * numStrands # top slot of each position
+    current = [None] * numStrands # slot the strand in each position leaves from
+
+    def attach(pos, slot):
+        if current[pos] is None:
+            first[pos] = slot
+        else:
+            builder.connect(current[pos], slot)
+
+    for g in word:
+        if g == 0 or abs(g) >= numStrands:
+            raise ValueError("Generator {} doesn't fit {} strands".format(g, numStrands))
+        pos = abs(g) - 1
+        c = builder.addCrossing(underNWSE=g > 0)
+        attach(pos, (c, NW))
+        attach(pos + 1, (c, NE))
+        current[pos], current[pos + 1] = (c, SW), (c, SE)
+
+    for pos in range(numStrands):
+        if first[pos] is None: # never crossed, a separate unknot
+            builder.numUnknots += 1
+        else:
+            builder.connect(current[pos], first[pos])
+    return builder.build(starts=[slot for slot in first if slot is not None])
+
+
+# the torus knot (or link, when p and q share a factor) T(p, q) as the closed
+# braid (sigma_1 ... sigma_p-1)^q. negative q gives the mirror image
+def torus(p, q):
+    if p < 1:
+        raise ValueError("T({}, {}) needs at least one strand".format(p, q))
+    sign = 1 if q >= 0 else -1
+    return fromBraid([sign * g for g in range(1, p)] * abs(q), p)
+
+
+# a pretzel link: columns of vertical half twists side by side, joined at the
+# top and bottom. a positive number of twists crosses like a positive braid
+# generator. components are oriented however the walk finds them
+def pretzel(*twists):
+    if not twists or 0 in twists:
+        raise ValueError("Every column of a pretzel needs some twists, got {}".format(twists))
+    builder = DiagramBuilder()
+    columns = [] # (top left, top right, bottom left, bottom right) slots
+    for t in twists:
+        cs = [builder.addCrossing(underNWSE=t > 0) for _ in range(abs(t))]
+        for above, below in zip(cs, cs[1:]):
+            builder.connect((above, SW), (below, NW))
+            builder.connect((above, SE), (below, NE))
+        columns.append(((cs[0], NW), (cs[0], NE), (cs[-1], SW), (cs[-1], SE)))
+
+    for left, right in zip(columns, columns[1:]):
+        builder.connect(left[1], right[0])
+        builder.connect(left[3], right[2])
+    builder.connect(columns[0][0], columns[-1][1]) # over the top
+    builder.connect(columns[0][2], columns[-1][3]) # under the bottom
+    return builder.build()
+
+
+# the twist knot with n half twists above a clasp: n = 1 is the trefoil, 2 the
+# figure eight, then 5_2, 6_1, 7_2, 8_1... in the same chirality as
+# homfly_polys.csv. negative n gives the mirror image
+def twist(n):
+    if n == 0:
+        raise ValueError("A twist knot needs at least one half twist")
+    sign = 1 if n > 0 else -1
+    return pretzel(-n, -sign, -sign)
+
+
+# a diagram from a PD code: one [a, b, c, d] per crossing, arcs counted
+# counterclockwise from the under strand coming in (KnotInfo's convention)
+def fromPD(pd):
+    builder = DiagramBuilder()
+    arcSlots = dict() # arc label => slots it's attached to
+    for labels in pd:
+        c = builder.addCrossing(underNWSE=False)
+        for slot, label in zip([NE, NW, SW, SE], labels):
+            arcSlots.setdefault(label, []).append((c, slot))
+    for label, slots in arcSlots.items():
+        if len(slots) != 2:
+            raise ValueError("Arc {} is attached in {} places".format(label, len(slots)))
+        builder.connect(*slots)
+    return builder.build(starts=[(c, NE) for c in range(len(pd))])
+
+
+# the permutation a braid word takes its strands through
+def getPermutation(word, numStrands):
+    perm = list(range(numStrands))
+    for g in word:
+        pos = abs(g) - 1
+        perm[pos], perm[pos + 1] = perm[pos + 1], perm[pos]
+    return perm
+
+
+# whether the closure of a braid is a knot (its permutation is one cycle)
+def closesToKnot(word, numStrands):
+    perm = getPermutation(word, numStrands)
+    pos, length = perm[0], 1
+    while pos != 0:
+        pos = perm[pos]
+        length += 1
+    return length == numStrands
+
+
+# a random braid word with numCrossings generators on numStrands strands. with
+# knot set, only words that close up to a knot are returned
+def randomBraidWord(numCrossings, numStrands=3, knot=True, rng=random):
+    if numStrands < 2:
+        raise ValueError("A braid needs at least 2 strands to cross")
+    if knot and (numCrossings < numStrands - 1 or (numCrossings - numStrands + 1) % 2):
+        raise ValueError("No {} crossing braid on {} strands closes up to a knot".format(
+            numCrossings, numStrands
+        ))
+    for _ in range(MAX_RANDOM_TRIES):
+        word = [
+            rng.randint(1, numStrands - 1) * rng.choice([1, -1]) for _ in range(numCrossings)
+        ]
+        if not knot or closesToKnot(word, numStrands):
+            return word
+    raise ValueError("Couldn't find a braid on {} strands that closes to a knot".format(numStrands))
+
+
+# a random diagram with numCrossings crossings, the closure of a random braid
+def randomDiagram(numCrossings, numStrands=3, knot=True, rng=random):
+    return fromBraid(randomBraidWord(numCrossings, numStrands, knot, rng), numStrands)
@@ -8,6 +8,74 @@ from math import sin, cos, radians, degrees, sqrt, atan, isnan, isinf
 from statistics import mean
 import numpy as np
 import json
+from skimage import color, morphology, img_as_float
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+
+# return the binary skeleton of an image of a knot (dark lines on white)
+def skeletonizeImage(imageData):
+    image = img_as_float(color.rgb2gray(imageData))
+    image_binary = image < 0.5
+    return morphology.skeletonize(image_binary)
+
+# for every pixel of a boolean image, count how many of its 8 neighbors are set
+# (pixels that aren't set get 0)
+def countNeighbors(mask):
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    kernel[1, 1] = 0
+    counts = ndimage.convolve(mask.astype(np.uint8), kernel, mode='constant', cval=0)
+    return counts * mask
+
+# sparse adjacency matrix between the set pixels of a boolean image, nodes are
+# numbered in row by row order (same as np.nonzero). if labels is given, only
+# neighbors with the same label are connected
+def getPixelGraph(mask, labels=None):
+    rows, cols = np.nonzero(mask)
+    index = np.full(mask.shape, -1, dtype=np.int64)
+    index[rows, cols] = np.arange(len(rows))
+    height, width = mask.shape
+    sources, targets = [], []
+    for dRow, dCol in [(0, 1), (1, -1), (1, 0), (1, 1)]: # other half is symmetric
+        nRows, nCols = rows + dRow, cols + dCol
+        valid = (0 <= nRows) & (nRows < height) & (0 <= nCols) & (nCols < width)
+        nodes = np.nonzero(valid)[0]
+        neighbors = index[nRows[valid], nCols[valid]]
+        keep = neighbors >= 0
+        if labels is not None:
+            keep &= labels[rows[nodes], cols[nodes]] == labels[nRows[valid], nCols[valid]]
+        sources.append(nodes[keep])
+        targets.append(neighbors[keep])
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    data = np.ones(len(sources), dtype=np.int8)
+    n = len(rows)
+    return coo_matrix((data, (sources, targets)), shape=(n, n)).tocsr()
+
+# shortest distances between segments a0->a1 and b0->b1, all (n, 2) arrays
+def segmentDistances(a0, a1, b0, b1):
+    # distance from points p to segments s0->s1
+    def pointToSegment(p, s0, s1):
+        d = s1 - s0
+        lengthSq = np.einsum('ij,ij->i', d, d)
+        t = np.einsum('ij,ij->i', p - s0, d) / np.where(lengthSq == 0, 1, lengthSq)
+        t = np.clip(t, 0, 1)
+        closest = s0 + t[:, None] * d
+        return np.hypot(*(p - closest).T)
+
+    def cross(o, p, q):
+        return (p[:, 0]-o[:, 0])*(q[:, 1]-o[:, 1]) - (p[:, 1]-o[:, 1])*(q[:, 0]-o[:, 0])
+
+    # segments that properly cross are at distance 0
+    crosses = ((cross(a0, a1, b0) * cross(a0, a1, b1) < 0)
+        & (cross(b0, b1, a0) * cross(b0, b1, a1) < 0))
+
+    dists = np.minimum.reduce([
+        pointToSegment(a0, b0, b1),
+        pointToSegment(a1, b0, b1),
+        pointToSegment(b0, a0, a1),
+        pointToSegment(b1, a0, a1)
+    ])
+    return np.where(crosses, 0.0, dists)
 
 # implementation of Bresenham's line drawing algorithm to return an
 # ordered array of integers from one point to another. Credit Wikipedia.
@@ -0,0 +1,127 @@
+from sympy import symbols, Rational
+from LaurentPoly import LaurentPoly
+from BraidTools import compress
+
+# Jones polynomial through the Kauffman bracket. crossings are added one at a
+# time and we keep a table of every way the strands leaving the finished part
+# of the diagram can be joined up inside it (Temperley-Lieb states), so the
+# work depends on how many strands cross that boundary instead of 2^n.
+#
+# bracket polynomials are LaurentPolys in A, stored as the first variable
+
+A = LaurentPoly.monomial(1, 1, 0)
+LOOP = -A**2 - A**-2 # value of a closed loop
+
+
+# order the crossings so few arcs are left dangling at any point: always take
+# the crossing that closes up the most open arcs, then the one opening fewest
+def getCrossingOrder(crossings):
+    arcCrossings = dict()
+    for c, cData in enumerate(crossings):
+        for arc in cData.values():
+            arcCrossings.setdefault(arc, set()).add(c)
+
+    order = []
+    done = set()
+    openArcs = set()
+    while len(order) < len(crossings):
+        candidates = set()
+        for arc in openArcs:
+            candidates |= arcCrossings[arc] - done
+        if not candidates: # start (or restart for a split diagram)
+            candidates = {min(c for c in range(len(crossings)) if c not in done)}
+
+        def score(c):
+            arcs = set(crossings[c].values())
+            return (-len(arcs & openArcs), len(arcs - openArcs), c)
+        c = min(candidates, key=score)
+
+        order.append(c)
+        done.add(c)
+        for arc in set(crossings[c].values()):
+            if arcCrossings[arc] <= done:
+                openArcs.discard(arc)
+            else:
+                openArcs.add(arc)
+    return order
+
+
+# join arc x to arc y in a matching of open arcs. returns the new matching and
+# the number of loops that closed
+def joinArcs(matching, x, y):
+    if x == y: # arc leaves and comes straight back
+        return matching, 1
+    xPartner, yPartner = matching.get(x), matching.get(y)
+    if xPartner is not None and xPartner == y: # the two ends meet
+        del matching[x]
+        del matching[y]
+        return matching, 1
+    if xPartner is not None:
+        del matching[x]
+    else:
+        xPartner = x
+    if yPartner is not None:
+        del matching[y]
+    else:
+        yPartner = y
+    matching[xPartner] = yPartner
+    matching[yPartner] = xPartner
+    return matching, 0
+
+
+# Kauffman bracket of a diagram, normalized so a single loop is 1
+def kauffmanBracket(crossings, hands, numUnknots=0):
+    if not crossings:
+        return LOOP**(numUnknots - 1) if numUnknots > 0 else LaurentPoly.monomial(1)
+
+    # states are (open arc pairs, closed a loop yet) => coefficient. the first
+    # loop isn't counted so that a lone circle comes out as 1
+    states = {((), False): LaurentPoly.monomial(1)}
+    for c in getCrossingOrder(crossings):
+        cData = crossings[c]
+
+        # arms counterclockwise starting from the incoming under strand
+        if hands[c] == 'right':
+            a, b, cc, d = cData['j'], cData['i1'], cData['k'], cData['i0']
+        else:
+            a, b, cc, d = cData['j'], cData['i0'], cData['k'], cData['i1']
+        smoothings = [(A, [(a, b), (cc, d)]), (A**-1, [(a, d), (b, cc)])]
+
+        newStates = dict()
+        for (pairs, closedAny), coeff in states.items():
+            for weight, joins in smoothings:
+                matching = dict()
+                for x, y in pairs:
+                    matching[x] = y
+                    matching[y] = x
+                loops = 0
+                for x, y in joins:
+                    matching, closed = joinArcs(matching, x, y)
+                    loops += closed
+                newCoeff = coeff * weight
+                if loops > 0:
+                    newCoeff = newCoeff * LOOP**(loops - (0 if closedAny else 1))
+                key = (
+                    tuple(sorted((x, y) for x, y in matching.items() if x < y)),
+                    closedAny or loops > 0
+                )
+                newStates[key] = newStates.get(key, 0) + newCoeff
+        states = newStates
+
+    bracket = sum([coeff for (pairs, _), coeff in states.items() if not pairs], LaurentPoly())
+    return bracket * LOOP**numUnknots
+
+
+# Jones polynomial of a diagram as a sympy expression in t
+def compute(ijkCrossings, handedness, numUnknots=0):
+    crossings, hands = compress(ijkCrossings, handedness)
+    bracket = kauffmanBracket(crossings, hands, numUnknots)
+
+    # V(t) = (-A^3)^-writhe <D> with A = t^(-1/4)
+    writhe = sum([1 if hand == 'right' else -1 for hand in hands])
+    jones = bracket * (-1 if writhe % 2 else 1) * A**(-3 * writhe)
+    t = symbols("t")
+    return sum(
+        [coeff * t**Rational(-aPow, 4) for (aPow, _), coeff in jones.terms.items()],
+        0
+    )
@@ -1,15 +1,278 @@
-from sympy import symbols, Matrix, expand
+from sympy import symbols
 from sympy import latex as latexForm
+from LaurentPoly import LaurentPoly
+import BraidTools as btools
+from SkeinTrace import SkeinTracer, TRACE_OFF, TRACE_FULL
+import JonesPolyTools as jtools
 from random import choice
+from collections import OrderedDict
+from multiprocessing import Pool
+import numpy as np
 import copy
 import json
 
+# order in which a crossing's dirs are checked
+DIR_ORDER = {'i1': 0, 'k': 1, 'i0': 2, 'j': 3}
+
+# column of each dir in a CompactKnot's crossing rows
+DIRS = ['i0', 'i1', 'j', 'k']
+DIR_COLS = {'i0': 0, 'i1': 1, 'j': 2, 'k': 3}
+
+# most places a single arc number can be attached at once (an arc has two
+# ends, and a smooth or removal briefly merges two arcs into one number)
+MAX_ARC_ENDS = 4
+
+# max number of sub-diagrams a HomflyCache remembers
+HOMFLY_CACHE_SIZE = 100000
+
+# skein tree depth below which computeHomfly(workers > 1) hands subtrees out
+HOMFLY_SPLIT_DEPTH = 3
+
 class RecError(Exception):
     pass
 
+# least-recently-used cache of solved sub-diagrams, keyed by Knot.getCanonicalKey
+class HomflyCache:
+    def __init__(self, maxSize=HOMFLY_CACHE_SIZE):
+        self.maxSize = maxSize
+        self.polys = OrderedDict() # canonical key => polynomial
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.polys)
+
+    def __str__(self):
+        return "HomflyCache({} entries, {} hits, {} misses)".format(
+            len(self.polys), self.hits, self.misses
+        )
+
+    # return the stored polynomial for a key, or None
+    def get(self, key):
+        if key in self.polys:
+            self.polys.move_to_end(key)
+            self.hits += 1
+            return self.polys[key]
+        self.misses += 1
+        return None
+
+    # store a polynomial, evicting the least recently used one if we're full
+    def put(self, key, poly):
+        self.polys[key] = poly
+        self.polys.move_to_end(key)
+        if len(self.polys) > self.maxSize:
+            self.polys.popitem(last=False)
+
+# solve the skein relation l*P+ + l^-1*P- + m*P0 = 0 for the polynomial of a
+# diagram, given those of its swapped and smoothed versions
+def skeinSolve(isRight, pSwapped, pSmoothed, l, m):
+    if isRight:
+        return (-m * pSmoothed - l**-1 * pSwapped) / l
+    return (-m * pSmoothed - l * pSwapped) * l
+
+# HOMFLY of an unlink of n components. the empty link (n = 0) would need
+# (l + l^-1)^-1, which isn't a Laurent polynomial
+def unlinkPoly(n, l, m):
+    if n < 1:
+        raise ValueError("The unlink needs at least one component, got {}".format(n))
+    return (-m**-1)**(n-1) * (l + l**(-1))**(n-1)
+
+# a polynomial that is still being computed in a worker process, or that is
+# built out of such polynomials. get() waits for it and caches the answer
+class PendingHomfly:
+    def __init__(self, compute, key, cache):
+        self.compute = compute
+        self.key = key
+        self.cache = cache
+
+    def __str__(self):
+        return "<pending>"
+
+    def get(self):
+        poly = self.compute()
+        self.cache.put(self.key, poly)
+        return poly
+
+# wait on a polynomial if it's pending
+def resolveHomfly(poly):
+    return poly if isinstance(poly, LaurentPoly) else poly.get()
+
+# runs in a worker process: solve one subtree of the skein tree on its own
+def homflySubtree(k, l, m, depth, depthLim, crossingsDist, strategy):
+    return SkeinEvaluator(
+        k, l, m, depthLim, HomflyCache(), strategy=strategy, depth=depth, crossingsDist=crossingsDist
+    ).run()
+
+# the skein poly of a node once its children are known, pending if either is
+def combineHomfly(isRight, pSwapped, pSmoothed, l, m, key, cache):
+    if not isinstance(pSwapped, LaurentPoly) or not isinstance(pSmoothed, LaurentPoly):
+        # still waiting on workers, combine once they're done
+        return PendingHomfly(
+            lambda: skeinSolve(isRight, resolveHomfly(pSwapped), resolveHomfly(pSmoothed), l, m),
+            key, cache
+        )
+    poly = skeinSolve(isRight, pSwapped, pSmoothed, l, m)
+    cache.put(key, poly)
+    return poly
+
+# a skein node waiting on its children. knot is only kept until the smoothed
+# child has been made from it
+class SkeinFrame:
+    __slots__ = ('knot', 'name', 'depth', 'crossingsDist', 'key', 'crossing', 'isRight', 'pSwapped')
+
+    def __init__(self, knot, depth, crossingsDist, key, crossing, isRight):
+        self.knot = knot
+        self.name = knot.name
+        self.depth = depth
+        self.crossingsDist = crossingsDist
+        self.key = key
+        self.crossing = crossing
+        self.isRight = isRight
+        self.pSwapped = None
+
+# works through the skein tree of a knot without recursion. nodes waiting on
+# their children sit on an explicit stack holding one diagram each, so memory
+# follows the depth of the tree. run(maxSteps) stops after that many nodes
+# and returns None, call it again to carry on from where it left off
+class SkeinEvaluator:
+    def __init__(self, knot, l=None, m=None, depthLim=float('inf'), cache=None, pool=None,
+            splitDepth=HOMFLY_SPLIT_DEPTH, tracer=None, strategy="lowest", depth=0,
+            crossingsDist=frozenset()):
+        self.l = LaurentPoly.monomial(1, 1, 0) if l is None else l
+        self.m = LaurentPoly.monomial(1, 0, 1) if m is None else m
+        self.depthLim = depthLim
+        self.cache = HomflyCache() if cache is None else cache
+        self.pool = pool
+        self.splitDepth = splitDepth
+        self.tracer = tracer
+        self.strategy = strategy
+        self.stack = [] # SkeinFrames, root first
+        self.next = (knot, depth, frozenset(crossingsDist), "root") # node to expand next
+        self.numSteps = 0
+        self.done = False
+        self.result = None
+
+    # expand nodes until the root is solved (returning its poly) or maxSteps
+    # nodes have been expanded (returning None)
+    def run(self, maxSteps=None):
+        steps = 0
+        while not self.done:
+            if maxSteps is not None and steps >= maxSteps:
+                return None
+            knot, depth, crossingsDist, branch = self.next
+            self.next = None
+            if self.tracer:
+                self.tracer.enter(knot.name, depth, branch)
+            poly = self._expand(knot, depth, crossingsDist)
+            steps += 1
+            self.numSteps += 1
+            if poly is not None:
+                if self.tracer:
+                    self.tracer.exit(depth)
+                self._finish(poly)
+        return self.result
+
+    # reduce a node and return its poly if it's a leaf, otherwise push it and
+    # queue its swapped child
+    def _expand(self, k, depth, crossingsDist):
+        l, m, cache, tracer = self.l, self.m, self.cache, self.tracer
+
+        # reduce all R1 and R2 crossings out of our knot
+        k.simplify(tracer=tracer)
+        k.name += "m"
+        if tracer:
+            tracer.event("diagram", level=TRACE_FULL, name=k.name, knot="\n" + str(k))
+
+        # we might have already solved this diagram under different labels
+        key = k.getCanonicalKey()
+        poly = cache.get(key)
+        if poly is not None:
+            if tracer:
+                tracer.event("cached", name=k.name, poly=poly)
+            return poly
+
+        # reached recursion limit
+        if depth >= self.depthLim:
+            raise RecError("Reached recursion limit")
+
+        # base case: k is an unlink of n components
+        if k.isUnlink():
+            n = k.numUnknots
+            poly = unlinkPoly(n, l, m)
+            if tracer:
+                tracer.event("basecase", name=k.name, unknots=n, poly=poly)
+            cache.put(key, poly)
+            return poly
+
+        # deep enough, let a worker process take the rest of this subtree
+        if self.pool is not None and depth >= self.splitDepth:
+            if tracer:
+                tracer.event("worker", name=k.name)
+            result = self.pool.apply_async(
+                homflySubtree, (k, l, m, depth, self.depthLim, crossingsDist, self.strategy)
+            )
+            return PendingHomfly(result.get, key, cache)
+
+        # get our distinguished crossing
+        if self.strategy == "descending":
+            distCrossing = k.getDescendingCrossing()
+            if distCrossing is None: # descending, so an unlink
+                n = len(k.getKnotPaths()) + k.numUnknots
+                poly = unlinkPoly(n, l, m)
+                if tracer:
+                    tracer.event("basecase", name=k.name, unknots=n, poly=poly)
+                cache.put(key, poly)
+                return poly
+        else:
+            validCrossings = [
+                i for i, c in enumerate(k.ijkCrossings)
+                if c is not None and i not in crossingsDist
+            ]
+            validCrossings.sort()
+            distCrossing = validCrossings[0]
+
+            # mark crossing as distinguished so it doesn't happen again
+            crossingsDist = crossingsDist | {distCrossing}
+        isRight = {'right': True, 'left': False}[k.handedness[distCrossing]]
+        if tracer:
+            tracer.event(
+                "split", name=k.name, crossing=distCrossing,
+                hand=k.handedness[distCrossing], distinguished=sorted(crossingsDist)
+            )
+
+        # the swapped child goes first, the smoothed one is made when it's done
+        kSwapped = k.duplicate()
+        kSwapped.name += "l" if isRight else "r"
+        kSwapped.swapCrossing(distCrossing)
+        self.stack.append(SkeinFrame(k, depth, crossingsDist, key, distCrossing, isRight))
+        self.next = (kSwapped, depth + 1, crossingsDist, "l" if isRight else "r")
+        return None
+
+    # hand a finished node's poly to its parent, solving every parent whose
+    # children are now both done
+    def _finish(self, poly):
+        while self.stack:
+            frame = self.stack[-1]
+            if frame.pSwapped is None:
+                frame.pSwapped = poly
+                kSmoothed, frame.knot = frame.knot, None
+                kSmoothed.name += "s"
+                kSmoothed.smoothCrossing(frame.crossing)
+                self.next = (kSmoothed, frame.depth + 1, frame.crossingsDist, "s")
+                return
+            self.stack.pop()
+            poly = combineHomfly(
+                frame.isRight, frame.pSwapped, poly, self.l, self.m, frame.key, self.cache
+            )
+            if self.tracer:
+                if isinstance(poly, LaurentPoly):
+                    self.tracer.event("solved", name=frame.name, depth=frame.depth, poly=poly)
+                self.tracer.exit(frame.depth)
+        self.result = poly
+        self.done = True
+
 class Knot:
     def __init__(self, ijkCrossings, handedness, numUnknots=0, name="", ijkCrossingNs=None):
-        print() #######################
         # convert from i, j, k crossings into i0, i1, j, k 
         nextNum = len(ijkCrossings) # number of arcs is same as number of crossings
         if ijkCrossingNs is not None:
@@ -39,8 +302,48 @@ class Knot:
         self.numUnknots = numUnknots
         self.name = name
 
-        
-    
+        # arc => [(crossing, dir), ...] for every place that arc is attached.
+        # after this it is only written through _addEnd and _dropEnd
+        self.arcEnds = dict()
+        for c, cData in enumerate(self.ijkCrossings):
+            if cData is not None:
+                for myDir, arc in cData.items():
+                    self.arcEnds.setdefault(arc, []).append((c, myDir))
+
+        # component paths and crossing => [path index], built by getKnotPaths
+        # and thrown away by anything that edits the diagram
+        self.knotPaths = None
+        self.crossingPathInds = None
+
+    # forget the cached component paths
+    def _clearPaths(self):
+        self.knotPaths = None
+        self.crossingPathInds = None
+
+    # record that an arc is attached to a crossing in some dir
+    def _addEnd(self, arc, c, myDir):
+        self.arcEnds.setdefault(arc, []).append((c, myDir))
+
+    # forget that an arc is attached to a crossing in some dir
+    def _dropEnd(self, arc, c, myDir):
+        ends = self.arcEnds[arc]
+        ends.remove((c, myDir))
+        if not ends:
+            del self.arcEnds[arc]
+
+    # point a crossing's dir at a given arc, keeping arcEnds current
+    def _setArc(self, c, myDir, arc):
+        self._dropEnd(self.ijkCrossings[c][myDir], c, myDir)
+        self.ijkCrossings[c][myDir] = arc
+        self._addEnd(arc, c, myDir)
+
+    # take a crossing out of the diagram, keeping arcEnds current
+    def _deleteCrossing(self, c):
+        for myDir, arc in self.ijkCrossings[c].items():
+            self._dropEnd(arc, c, myDir)
+        self.ijkCrossings[c] = None
+        self.handedness[c] = None
+
 
     def __str__(self):
         s = "---- Knot {}({}) ----\n".format(
@@ -63,20 +366,12 @@ class Knot:
         # get arcNum in that direction
         myArc = self.ijkCrossings[c][myDir]
 
-        # get all crossings that share the arc
-        crossingsOnArc = [
-            cr for cr, cData in enumerate(self.ijkCrossings) if 
-            cData is not None and any([arc == myArc for _, arc in cData.items()])
-        ]
-
-        # get the neighbor
-        if len(crossingsOnArc) == 1: # single loop back to self
-            n = crossingsOnArc[0]
-        else: 
-            n = [cr for cr in crossingsOnArc if cr != c][0]
-
-        # get the incoming direction on that crossing
-        incDir = [myDir for myDir, arc in self.ijkCrossings[n].items() if arc == myArc][0]
+        # get the neighbor and its dir (the other end of the arc). on a single
+        # loop back to self that's the same crossing in another dir
+        others = [(cr, d) for cr, d in self.arcEnds[myArc] if (cr, d) != (c, myDir)]
+        if not others:
+            return c, myDir
+        n, incDir = min(others)
 
         return n, incDir
 
@@ -127,21 +422,23 @@ class Knot:
     # update a crossing with given dirs and crossings in newCrossings
     # propogate the change the neighbors as well
     def updateCrossing(self, c, newCrossings):
+        self._clearPaths()
         for myDir, newArc in newCrossings.items():
             # get info first
             n, nIncDir = self.getNAndDir(c, myDir)
 
             # update self
-            self.ijkCrossings[c][myDir] = newArc
+            self._setArc(c, myDir, newArc)
 
             # update neighbor
-            self.ijkCrossings[n][nIncDir] = newArc
+            self._setArc(n, nIncDir, newArc)
 
     # swap handedness of a given crossing in-place
     def swapCrossing(self, c):
         if c is None:
             print("Error: Can't swap a crossing that's already removed")
             return
+        self._clearPaths()
 
         # get connected arcs
         i0 = self.ijkCrossings[c]['i0']
@@ -150,10 +447,10 @@ class Knot:
         k = self.ijkCrossings[c]['k']
 
         # only swap crossings, no need to propogate changes
-        self.ijkCrossings[c]['i0'] = j
-        self.ijkCrossings[c]['i1'] = k
-        self.ijkCrossings[c]['j'] = i0
-        self.ijkCrossings[c]['k'] = i1
+        self._setArc(c, 'i0', j)
+        self._setArc(c, 'i1', k)
+        self._setArc(c, 'j', i0)
+        self._setArc(c, 'k', i1)
 
         # switch the handedness
         self.handedness[c] = {'left': 'right', 'right': 'left'}[self.handedness[c]]
@@ -163,6 +460,7 @@ class Knot:
         if c is None:
             print("Error: Can't smooth a crossing that's already removed")
             return
+        self._clearPaths()
 
         # get all info needed
         i0 = self.ijkCrossings[c]['i0']
@@ -180,8 +478,7 @@ class Knot:
         })
 
         # remove crossing
-        self.ijkCrossings[c] = None
-        self.handedness[c] = None
+        self._deleteCrossing(c)
 
         # increase the number of unknots
         self.numUnknots += numSameArcs
@@ -190,51 +487,30 @@ class Knot:
     # loop goes, and the type of all crossings between ('over' or 'under').
     def getR1Crossing(self):
 
-        # for each crossing
-            # it's an r1 crossing if, for some path that that it belongs to,
-            # for all other knots, that we intersect with, our knot goes over or under
-        
-        # check if there are R1 crossings to resolve between links
-        inters = {} # path 1 => path2: way it crosses over
-        for c in range(len(self.ijkCrossings)):
-            if self.ijkCrossings[c] is not None:
-
-                # get all knots this crossing belongs to
-                myPaths = self.getCrossingPaths(c)
-
-                # check all of crossing's paths against each other
-                for path1Ind, path1 in enumerate(myPaths):
-                    # keep track of each path we hit and whether we go under or over
-                    for path2Ind, path2 in enumerate(myPaths):
-                        if path1 != path2: # two paths intersect at crossing c
-                            # convert both paths to over/under style
-                            p1C = {
-                                cr: "over" if myDir in ['i0', 'i1'] else "under"
-                                for cr, myDir in path1
-                            }
-                            # crossings with a loop will be overriden but that's okay,
-                            # crossings with a loop can't be a link
-                            
-                            if path1Ind in inters:
-                                inters[path1Ind][path2Ind].append((c, p1C[c]))
-                            else:
-                                inters[path1Ind] = {path2Ind: [(c, p1C[c])]}
-
-        # check any intersections
-        for path1Ind, path1 in inters.items():
-            for path2Ind, cs in path1.items():
-                styles = [style for _, style in cs]
-                if all([style == styles[0] for style in styles]):
-                    # any shared crossing between the paths can be removed
-                    return cs[0][0], [], None, None
+        # a component that passes over (or under) every other component it
+        # meets can be lifted off the rest, so its crossings with them can go.
+        # this has to hold against all the others at once: with three or more
+        # components each pair can be layered while the whole link isn't
+        # (the borromean rings)
+        paths = self.getKnotPaths()
+        if len(paths) > 1:
+            for path in paths:
+                shared = [
+                    (c, "over" if myDir == 'i1' else "under") for c, myDir in path
+                    if len(self.crossingPathInds[c]) > 1
+                ]
+                if shared and all([style == shared[0][1] for _, style in shared]):
+                    return shared[0][0], [], None, None
 
 
         # if you can't move links apart, then any R1 moves will be twisted, 
         # and we can detect as follows
         
-        # check each crossing
+        # check each crossing. only one component passes through an R1 crossing,
+        # walking away from one between two components goes all the way round
+        # and comes back on the same strand, which isn't a loop
         for c in range(len(self.ijkCrossings)):
-            if self.ijkCrossings[c] is not None:
+            if self.ijkCrossings[c] is not None and len(self.crossingPathInds[c]) == 1:
                 for myDir in ['i0', 'i1']: # try both directions
                     betweens = self.getCrossingsBetween(c, c, myDir)
                     if len(betweens) != 1: # link R2 crossings already ruled out
@@ -251,29 +527,130 @@ class Knot:
         return None, None, None, None
 
     # repeatedly reduces all R1 crossings until there are none left
-    def reduceR1s(self, numReductions=float("inf")):
+    # removals are reported to tracer (a SkeinTracer) if there is one
+    def reduceR1s(self, numReductions=float("inf"), tracer=None):
 
         # identify an R1 crossing and remove it via an R1 move
         # we know that the path doesn't contain the same vertex twice
         reduced = 0
         while True:
-            print("Reduction #{}".format(reduced + 1))
             c, csBetweenSelf, myDir, pathType = self.getR1Crossing()
             if c is not None and reduced < numReductions:
                 for cBetweenSelf in csBetweenSelf + [c]: # must remove c last TODO: CHECK THIS
                     numU = self.numUnknots
                     self.removeCrossing(cBetweenSelf)
-                    diff = self.numUnknots - numU
-                    if diff == 0:
-                        text = ""
-                    else:
-                        text = " (+{} unknots)".format(diff)
-                    print("  - Remove {}{}".format(cBetweenSelf, text))
+                    if tracer:
+                        tracer.r1Removal(self.name, cBetweenSelf, self.numUnknots - numU)
                 reduced += 1
             else:
-                print(" - nothing, all done")
                 break
 
+    # faces of the diagram as lists of (arc, forward) darts (see BraidTools),
+    # or None if the handedness doesn't give a planar diagram
+    def getFaces(self):
+        crossings, hands = btools.compress(self.ijkCrossings, self.handedness)
+        if not crossings:
+            return []
+        faces = btools.getFaces(crossings, hands, btools.getArcEnds(crossings))
+        if len(faces) != len(crossings) + 2 * len(btools.getPieces(crossings)):
+            return None
+        return faces
+
+    # return two crossings that bound a bigon with one strand over at both,
+    # which an R2 move takes out, or None, None
+    def getR2Crossings(self, faces):
+        for face in faces:
+            if len(face) != 2:
+                continue
+            (a, _), (b, _) = face
+            c1, c1OutDir, c2, c2IncDir = self.getArcCrossings(a)
+            bEnds = self.getArcCrossings(b)
+            if c1 == c2 or set([c1, c2]) != set([bEnds[0], bEnds[2]]):
+                continue
+            if (c1OutDir, c2IncDir) in [('i1', 'i0'), ('k', 'j')] \
+                    and self.handedness[c1] != self.handedness[c2]:
+                return c1, c2
+        return None, None
+
+    # the crossing slots an R3 move on a triangle face rewrites, as
+    # [(crossing, dir, new arc)], or None if the triangle can't be moved.
+    # every strand meets the other two in the opposite order afterwards, so
+    # each triangle side keeps its arc and the outer arcs trade crossings
+    def getR3Move(self, face):
+        if len(face) != 3:
+            return None
+        sides = [self.getArcCrossings(arc) + (arc,) for arc, _ in face]
+        if len(set([side[0] for side in sides] + [side[2] for side in sides])) != 3:
+            return None
+
+        # alternating triangles (every strand over once and under once) are stuck
+        if not any([
+            (outDir, incDir) in [('i1', 'i0'), ('k', 'j')]
+            for _, outDir, _, incDir, _ in sides
+        ]):
+            return None
+
+        sideArcs = [arc for arc, _ in face]
+        writes = []
+        for x, xOutDir, y, yIncDir, arc in sides:
+            xIncDir = {'i1': 'i0', 'k': 'j'}[xOutDir]
+            yOutDir = {'i0': 'i1', 'j': 'k'}[yIncDir]
+            before, after = self.ijkCrossings[x][xIncDir], self.ijkCrossings[y][yOutDir]
+            if before in sideArcs or after in sideArcs:
+                return None
+            writes += [
+                (y, yIncDir, before), (y, yOutDir, arc),
+                (x, xIncDir, arc), (x, xOutDir, after)
+            ]
+        return writes
+
+    # apply slot writes from getR3Move, returning the writes that undo them
+    def performR3Move(self, writes):
+        self._clearPaths()
+        undo = [(c, myDir, self.ijkCrossings[c][myDir]) for c, myDir, _ in writes]
+        for c, myDir, arc in writes:
+            self._setArc(c, myDir, arc)
+        return undo
+
+    # try R3 moves on every triangle, keeping the first one after which an R1 or
+    # R2 move is possible. returns whether one was kept
+    def exposeByR3(self, faces, tracer=None):
+        for face in faces:
+            writes = self.getR3Move(face)
+            if writes is None:
+                continue
+            undo = self.performR3Move(writes)
+            newFaces = self.getFaces()
+            if newFaces is not None and (
+                self.getR2Crossings(newFaces)[0] is not None
+                or self.getR1Crossing()[0] is not None
+            ):
+                if tracer:
+                    tracer.r3Move(self.name, sorted(set([c for c, _, _ in writes])))
+                return True
+            self.performR3Move(undo)
+        return False
+
+    # take out R1s and R2 bigons until there are none, using R3 moves to make
+    # more where one will. every pass removes crossings, so this always ends.
+    # R2/R3 need a planar diagram, if it isn't only R1s are reduced
+    def simplify(self, tracer=None):
+        while True:
+            self.reduceR1s(tracer=tracer)
+            faces = self.getFaces()
+            if faces is None:
+                return
+            c1, c2 = self.getR2Crossings(faces)
+            if c1 is not None:
+                numU = self.numUnknots
+                self.removeCrossing(c1)
+                self.removeCrossing(c2)
+                if tracer:
+                    tracer.r2Removal(self.name, c1, c2, self.numUnknots - numU)
+                continue
+            if not self.exposeByR3(faces, tracer):
+                return
+
     # remove a crossing from a knot diagram, connecting the neighbors to each other
     # it's possible that this puts the diagram in an invalid state
     # could add unknots
@@ -283,13 +660,24 @@ class Knot:
         if crossing is None:
             print("Error: Can't remove a crossing that's already removed")
             return
+        self._clearPaths()
         i0, i1, j, k = crossing['i0'], crossing['i1'], crossing['j'], crossing['k']
 
         # increase unknots
         if i0 == i1 and j == k: # last connection btwn two links
             self.numUnknots += 2
-        if i0 == k and i1 == j: # just a twisted unknot
+        elif i0 == k and i1 == j: # just a twisted unknot
+            self.numUnknots += 1
+        elif i0 == i1: # over strand is a loop through only us, it comes off
+            self.numUnknots += 1
+            self.updateCrossing(c, {
+                'k': j
+            })
+        elif j == k: # same for the under strand
             self.numUnknots += 1
+            self.updateCrossing(c, {
+                'i1': i0
+            })
         else:
             # if it's just a single loop, we want to take the correct j/k and
             # merge with i1/i0
@@ -308,201 +696,435 @@ class Knot:
                 })
 
         # remove crossing
-        self.ijkCrossings[c] = None
-        self.handedness[c] = None
+        self._deleteCrossing(c)
 
     # return a duplicated version of this knot (optionally named)
     def duplicate(self, name=None):
-        return Knot(
+        knot = Knot(
             copy.deepcopy(self.ijkCrossings),
             copy.deepcopy(self.handedness),
             self.numUnknots,
             name=self.name if name is None else name
         )
+        # same diagram, so the paths carry over until one of them is edited
+        knot.knotPaths, knot.crossingPathInds = self.knotPaths, self.crossingPathInds
+        return knot
 
     # return all arcs in given knot diagram
     def getArcs(self):
-        arcs = set()
-        for crossing, crossingData in enumerate(self.ijkCrossings):
-            if crossingData is not None:
-                for myDir, arc in crossingData.items():
-                    arcs.add(arc)
-        return arcs
+        return set(self.arcEnds.keys())
 
     # returns crossings and incoming dirs on a given arc, in order of direction
+    # (tail crossing, tail dir, head crossing, head dir)
     def getArcCrossings(self, arc):
         c1, c2, c1IncDir, c2IncDir = None, None, None, None
-        for c in range(len(self.ijkCrossings)):
-            if self.ijkCrossings[c] is not None:
-                if self.ijkCrossings[c]['i1'] == arc:
-                    c1, c1IncDir = c, 'i1'
-                if self.ijkCrossings[c]['k'] == arc:
-                    c1, c1IncDir = c, 'k'
-                if self.ijkCrossings[c]['i0'] == arc:
-                    c2, c2IncDir = c, 'i0'
-                if self.ijkCrossings[c]['j'] == arc:
-                    c2, c2IncDir = c, 'j'
+        for c, myDir in sorted(self.arcEnds.get(arc, []), key=lambda end: (end[0], DIR_ORDER[end[1]])):
+            if myDir == 'i1' or myDir == 'k':
+                c1, c1IncDir = c, myDir
+            else:
+                c2, c2IncDir = c, myDir
         return c1, c1IncDir, c2, c2IncDir
 
-    # returns all unique (crossing, dir) paths around our knot diagram
-    def getKnotPaths(self): 
-        def cyclicEquiv(a, b): # credit to stackoverflow user salvador-dali
-            if len(a) != len(b):
-                return False
-            str1 = ' '.join(map(str, a))
-            str2 = ' '.join(map(str, b))
-            if len(str1) != len(str2):
-                return False
-            return str1 in str2 + ' ' + str2
-
-        # get all arcs
-        arcsToCheck = self.getArcs()
-
-        # keep track of all paths
-        paths = []
+    # relabel crossings and arcs in the order a traversal from startArc meets
+    # them. components are taken in the order they're reached: after closing
+    # one, continue on the unvisited strand of the earliest relabeled crossing
+    def _relabelFrom(self, startArc):
+        newArcs = dict() # old arc => new arc
+        newCrossings = dict() # old crossing => new crossing
+        order = [] # old crossings in new order
+        while startArc is not None:
+            arc = startArc
+            while arc not in newArcs:
+                newArcs[arc] = len(newArcs)
+                _, _, c, incDir = self.getArcCrossings(arc)
+                if c not in newCrossings:
+                    newCrossings[c] = len(newCrossings)
+                    order.append(c)
+                arc = self.ijkCrossings[c]['i1' if incDir == 'i0' else 'k']
+
+            # find where to pick up the next component
+            startArc = None
+            for c in order:
+                for myDir in ['i1', 'k']:
+                    if self.ijkCrossings[c][myDir] not in newArcs:
+                        startArc = self.ijkCrossings[c][myDir]
+                        break
+                if startArc is not None:
+                    break
+            if startArc is None and len(newArcs) < len(self.arcEnds):
+                # split diagram, nothing connects us to the rest
+                startArc = min(arc for arc in self.arcEnds if arc not in newArcs)
+
+        return tuple(
+            (
+                newArcs[self.ijkCrossings[c]['i0']],
+                newArcs[self.ijkCrossings[c]['i1']],
+                newArcs[self.ijkCrossings[c]['j']],
+                newArcs[self.ijkCrossings[c]['k']],
+                self.handedness[c] == 'right'
+            )
+            for c in order
+        )
 
-        for sourceArc in arcsToCheck:
+    # a hashable description of the diagram that doesn't depend on how its
+    # crossings and arcs happen to be numbered. the smallest relabeling over
+    # every arc that leaves a crossing on the under strand is used
+    def getCanonicalKey(self):
+        starts = [
+            cData['k'] for cData in self.ijkCrossings if cData is not None
+        ]
+        relabeled = min([self._relabelFrom(arc) for arc in starts], default=())
+        return (self.numUnknots, relabeled)
+
+    # returns all unique (crossing, dir) paths around our knot diagram. these
+    # are cached until the diagram changes, so don't edit what comes back
+    def getKnotPaths(self):
+        if self.knotPaths is None:
+            self.knotPaths = self._findKnotPaths()
+            self.crossingPathInds = dict()
+            for pathInd, path in enumerate(self.knotPaths):
+                for c, _ in path:
+                    inds = self.crossingPathInds.setdefault(c, [])
+                    if pathInd not in inds:
+                        inds.append(pathInd)
+        return self.knotPaths
+
+    # walk each component once, marking arcs as we go. every path is rotated
+    # to start at its smallest (crossing, dir) and paths are ordered by that
+    def _findKnotPaths(self):
+        nextDirs = {'i0': 'i1', 'j': 'k'}
+        visited = set()
+        paths = []
+        for sourceArc in sorted(self.arcEnds.keys()):
+            if sourceArc in visited:
+                continue
 
-            # create a new knot for this arc
+            # record the (crossing, dir) each arc leaves from, following the
+            # head of every arc onto the next one until we're back
             thisPath = []
-
-            # loop forward until we hit this arc again
             currArc = sourceArc
-            while True: # want to go at least once
-
-                # get the next crossing and incoming crossing
-                c1, c1OutDir, c2, c2IncDir = self.getArcCrossings(currArc)
+            while currArc not in visited:
+                visited.add(currArc)
+                c, incDir = [(c, myDir) for c, myDir in self.arcEnds[currArc] if myDir in nextDirs][-1]
+                nextDir = nextDirs[incDir]
+                thisPath.append((c, nextDir))
+                currArc = self.ijkCrossings[c][nextDir]
 
-                # figure out in which direction to continue searching
-                nextDir = {'i0': 'i1', 'i1': 'i0', 'j': 'k', 'k': 'j'}[c2IncDir]
+            start = thisPath.index(min(thisPath, key=lambda end: (end[0], DIR_ORDER[end[1]])))
+            paths.append(thisPath[start:] + thisPath[:start])
 
-                # get the next arc
-                nextArc = self.ijkCrossings[c2][nextDir]
-
-                # record findings
-                # thisPath.append((currArc, c2))
-                thisPath.append((c1, c1OutDir))
-                
-                # proceed and break if necessary
-                currArc = nextArc
-                if currArc == sourceArc:
-                    break
-            paths.append(thisPath)
-            
-        # reduce to unique crossing cycles
-        uniques = []
-        for a in paths:
-            exists = False
-            for b in uniques:
-                if cyclicEquiv(a, b):
-                    exists = True
-            if not exists:
-                uniques.append(a)
-        
-        return uniques
+        paths.sort(key=lambda path: (path[0][0], DIR_ORDER[path[0][1]]))
+        return paths
 
     # returns all paths that a given crossing belongs to
     def getCrossingPaths(self, c):
-        myPaths = []
+        paths = self.getKnotPaths()
+        return [paths[pathInd] for pathInd in self.crossingPathInds.get(c, [])]
+
+    # the first crossing that a walk along every component (in getKnotPaths
+    # order, from the start of each path) meets on its under strand, or None
+    # if there isn't one. switching them all makes the diagram descending:
+    # each component lies above the ones after it and every crossing is
+    # first met going over, so it's an unlink of one circle per component
+    def getDescendingCrossing(self):
+        seen = set()
         for path in self.getKnotPaths():
-            for cr, _ in path:
-                if cr == c:
-                    myPaths.append(path)
-                    break
-        return myPaths
+            for c, myDir in path:
+                if c not in seen:
+                    if myDir == 'k':
+                        return c
+                    seen.add(c)
+        return None
+
+    # compute the homfly polynomial by working through the skein tree
+    # set latex to true to format it latex style
+    # pass a HomflyCache to share solved sub-diagrams between calls, the one
+    # used is kept on self.homflyCache
+    # set compact to run the recursion on CompactKnot copies
+    # with workers > 1, subtrees below splitDepth are solved in a process pool
+    # engine is "skein" for the recursion or "braid" to go through a closed
+    # braid and the Hecke algebra (which ignores the skein-only options)
+    # trace is a SkeinTrace level or a SkeinTracer, the one used is kept on
+    # self.homflyTrace and its summary is printed at the end
+    # strategy picks the skein's crossings: "lowest" takes the lowest numbered
+    # one not yet used, "descending" switches crossings toward a descending
+    # diagram, so every branch ends after at most one switch per crossing
+    def computeHomfly(self, latex=False, depthLim=float('inf'), cache=None, compact=False,
+            workers=1, splitDepth=HOMFLY_SPLIT_DEPTH, engine="skein", trace=TRACE_OFF,
+            strategy="lowest"):
+
+        # the recursion works on LaurentPolys, only the answer becomes sympy
+        l, m = LaurentPoly.monomial(1, 1, 0), LaurentPoly.monomial(1, 0, 1)
+
+        if cache is None:
+            cache = HomflyCache()
+        self.homflyCache = cache
+
+        tracer = trace if isinstance(trace, SkeinTracer) else (SkeinTracer(trace) if trace else None)
+        if tracer:
+            tracer.cache = cache
+        self.homflyTrace = tracer
+
+        # nothing to take the polynomial of
+        if self.isUnlink() and self.numUnknots == 0:
+            return "Empty diagram"
 
-    # internal recursive function for computing homfly
-    def _homfly(self, k, l, m, depth, depthLim, crossingsDist):
-        print("{}: computing HOMFLY:".format(k.name))
+        try:
+            root = self.toCompact(name="K") if compact else self.duplicate(name="K")
+            if engine == "braid":
+                root.simplify(tracer=tracer)
+                poly = btools.computeHomfly(
+                    root.ijkCrossings, root.handedness, root.numUnknots, l, m, tracer
+                )
+            elif workers > 1:
+                with Pool(workers) as pool:
+                    poly = resolveHomfly(SkeinEvaluator(
+                        root, l, m, depthLim, cache, pool, splitDepth, tracer, strategy
+                    ).run())
+            else:
+                poly = SkeinEvaluator(root, l, m, depthLim, cache, tracer=tracer, strategy=strategy).run()
+            if tracer:
+                tracer.printSummary()
+            homfly = poly.toSympy(*symbols("l m"))
+            return latexForm(homfly) if latex else homfly
+        except RecError:
+            return "Recursion Error"
+        except IndexError:
+            return "Ran out of crossings to distinguish"
+        except Exception as e:
+            return e
 
-        # reduce all R1 crossings out of our knot
-        k.reduceR1s()
-        k.name += "m"
-        print()
-        print(k)
 
-        # reached recursion limit
-        if depth >= depthLim:
-            raise RecError("Reached recursion limit")
+    # compute the jones polynomial (in t) from the kauffman bracket
+    # set latex to true to format it latex style
+    def computeJones(self, latex=False):
+        jones = jtools.compute(self.ijkCrossings, self.handedness, self.numUnknots)
+        return latexForm(jones) if latex else jones
 
-        # base case: k is an unlink of n components
-        if k.isUnlink():
-            n = k.numUnknots
-            poly = (-m**-1)**(n-1) * (l + l**(-1))**(n-1)
-            print("{}: hit basecase, n={}:  {}".format(k.name, n, poly))
-            return poly
+    # return a copy of this knot stored as a CompactKnot
+    def toCompact(self, name=None):
+        return CompactKnot.fromKnot(self, name)
 
-        # get our distinguished crossing
-        print("Distinguished so far: {}".format(crossingsDist))
-        validCrossings = [
-            i for i, c in enumerate(k.ijkCrossings)
-            if c is not None and i not in crossingsDist
-        ]
-        validCrossings.sort()
-        distCrossing = validCrossings[0]
-        isRight = {'right': True, 'left': False}[k.handedness[distCrossing]]
 
-        # mark crossing as distinguished so it doesn't happen again
-        crossingsDist.add(distCrossing)
-        
-        # copy knot, append modification to name
-        kR, kL, kS = k.duplicate(), k.duplicate(), k.duplicate()
-        kR.name += "r"
-        kL.name += "l"
-        kS.name += "s"
-
-        # modify accordingly
-        if isRight:
-            print("{}: swapping '{}' from right to left to get {}".format(k.name, distCrossing, kL.name))
-            kL.swapCrossing(distCrossing)
-        else:
-            print("{}: swapping '{}' from left to right to get {}".format(k.name, distCrossing, kR.name))
-            kR.swapCrossing(distCrossing)
-        print("{}: smoothing '{}' to get {}".format(k.name, distCrossing, kS.name))
-        kS.smoothCrossing(distCrossing)
-
-        print()
-        if isRight:
-            print(kL)
-        else:
-            print(kR)
-        print(kS)
+# everything a CompactKnot stores. rows [0, n) of buf are the crossings'
+# (i0, i1, j, k) arcs, row n + arc lists the (crossing * 4 + column) places
+# that arc is attached, padded with -1. handedness and removal are bitmasks
+class CompactState:
+    def __init__(self, buf, numCrossings, rightMask, removedMask):
+        self.buf = buf
+        self.mv = memoryview(buf) # plain python ints on access
+        self.n = numCrossings
+        self.rightMask = rightMask
+        self.removedMask = removedMask
 
-        # compute necessary polynomials
-        if isRight:
-            pL = self._homfly(kL, l, m, depth + 1, depthLim, copy.deepcopy(crossingsDist))
-            print("{}: solved: {}".format(kL.name, pL))
-        else:
-            pR = self._homfly(kR, l, m, depth + 1, depthLim, copy.deepcopy(crossingsDist))
-            print("{}: solved: {}".format(kR.name, pR))
-        pS = self._homfly(kS, l, m, depth + 1, depthLim, copy.deepcopy(crossingsDist))
-        print("{}: solved: {}".format(kS.name, pS))
-
-        # return equation solved for the correct polynomial
-        if isRight:
-            v = (-m * pS - l**-1 * pL) / l
+    def copy(self):
+        return CompactState(self.buf.copy(), self.n, self.rightMask, self.removedMask)
+
+    # memoryviews can't be pickled, rebuild it on the other side
+    def __getstate__(self):
+        return (self.buf, self.n, self.rightMask, self.removedMask)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+# dict-like view of one crossing of a CompactKnot
+class CompactCrossing:
+    __slots__ = ('mv', 'c')
+
+    def __init__(self, mv, c):
+        self.mv = mv
+        self.c = c
+
+    def __getitem__(self, myDir):
+        return self.mv[self.c, DIR_COLS[myDir]]
+
+    def __setitem__(self, myDir, arc):
+        self.mv[self.c, DIR_COLS[myDir]] = arc
+
+    def __iter__(self):
+        return iter(DIRS)
+
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def keys(self):
+        return list(DIRS)
+
+    def values(self):
+        return [self.mv[self.c, col] for col in range(4)]
+
+    def items(self):
+        return [(myDir, self.mv[self.c, col]) for col, myDir in enumerate(DIRS)]
+
+# list-like view of a CompactKnot's crossings, None where removed
+class CompactCrossings:
+    __slots__ = ('state',)
+
+    def __init__(self, state):
+        self.state = state
+
+    def __len__(self):
+        return self.state.n
+
+    def __getitem__(self, c):
+        if c < 0 or c >= self.state.n:
+            raise IndexError("crossing {} out of range".format(c))
+        if self.state.removedMask >> c & 1:
+            return None
+        return CompactCrossing(self.state.mv, c)
+
+    def __setitem__(self, c, cData):
+        if cData is None:
+            self.state.removedMask |= 1 << c
         else:
-            v = (-m * pS - l * pR) * l
-        ex = expand(v)
-        print("{}: returning {} => {}".format(k.name, v, ex))
-        return ex
+            for myDir, arc in cData.items():
+                self.state.mv[c, DIR_COLS[myDir]] = arc
+            self.state.removedMask &= ~(1 << c)
+
+    def __iter__(self):
+        return (self[c] for c in range(self.state.n))
+
+    def __repr__(self):
+        return repr(list(self))
+
+# list-like view of a CompactKnot's handedness, None where removed
+class CompactHandedness:
+    __slots__ = ('state',)
+
+    def __init__(self, state):
+        self.state = state
+
+    def __len__(self):
+        return self.state.n
+
+    def __getitem__(self, c):
+        if self.state.removedMask >> c & 1:
+            return None
+        return 'right' if self.state.rightMask >> c & 1 else 'left'
+
+    def __setitem__(self, c, hand):
+        # removal is tracked by CompactCrossings, nothing to do for None
+        if hand == 'right':
+            self.state.rightMask |= 1 << c
+        elif hand == 'left':
+            self.state.rightMask &= ~(1 << c)
+
+    def __iter__(self):
+        return (self[c] for c in range(self.state.n))
+
+    def __repr__(self):
+        return repr(list(self))
+
+# dict-like view of a CompactKnot's arc => [(crossing, dir), ...] index
+class CompactArcEnds:
+    __slots__ = ('state',)
+
+    def __init__(self, state):
+        self.state = state
+
+    def __getitem__(self, arc):
+        ends = self.get(arc)
+        if ends is None:
+            raise KeyError(arc)
+        return ends
+
+    def __contains__(self, arc):
+        return self.get(arc) is not None
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, arc, default=None):
+        row = self.state.n + arc
+        if arc < 0 or row >= self.state.buf.shape[0]:
+            return default
+        mv = self.state.mv
+        ends = [
+            (mv[row, e] >> 2, DIRS[mv[row, e] & 3])
+            for e in range(MAX_ARC_ENDS) if mv[row, e] >= 0
+        ]
+        return ends if ends else default
 
-    # recursively compute the homfly polynomial
-    # set latex to true to format it latex style
-    def computeHomfly(self, latex=False, depthLim=float('inf')):
+    def keys(self):
+        arcRows = self.state.buf[self.state.n:]
+        return np.flatnonzero((arcRows >= 0).any(axis=1)).tolist()
 
-        # share symbols with all new knots' equations
-        l, m = symbols("l m")
+# a Knot whose whole diagram lives in one int32 buffer, so duplicating it
+# (which SkeinEvaluator does twice per node) is a single array copy instead of
+# a deepcopy of lists of dicts. every Knot method works on it unchanged
+class CompactKnot(Knot):
+    def __init__(self, ijkCrossings, handedness, numUnknots=0, name="", ijkCrossingNs=None):
+        super().__init__(ijkCrossings, handedness, numUnknots, name, ijkCrossingNs)
+
+        # pack what Knot just built
+        crossings, hands, arcEnds = self.ijkCrossings, self.handedness, self.arcEnds
+        n = len(crossings)
+        numArcs = max(arcEnds.keys(), default=-1) + 1
+        buf = np.full((n + numArcs, 4), -1, dtype=np.int32)
+        rightMask, removedMask = 0, 0
+        for c, cData in enumerate(crossings):
+            if cData is None:
+                removedMask |= 1 << c
+            else:
+                buf[c] = [cData[myDir] for myDir in DIRS]
+                if hands[c] == 'right':
+                    rightMask |= 1 << c
+        for arc, ends in arcEnds.items():
+            if len(ends) > MAX_ARC_ENDS:
+                raise ValueError("arc {} is attached in {} places".format(arc, len(ends)))
+            for e, (c, myDir) in enumerate(ends):
+                buf[n + arc, e] = c * 4 + DIR_COLS[myDir]
+        self._setState(CompactState(buf, n, rightMask, removedMask))
+
+    # build a compact copy of any knot
+    @classmethod
+    def fromKnot(cls, knot, name=None):
+        return cls(
+            [None if cData is None else dict(cData.items()) for cData in knot.ijkCrossings],
+            list(knot.handedness),
+            knot.numUnknots,
+            name=knot.name if name is None else name
+        )
 
-        try:
-            homfly = self._homfly(self.duplicate(name="K"), l, m, 0, depthLim, set())
-            return latexForm(homfly) if latex else homfly
-        except RecError:
-            return "Recursion Error"
-        except IndexError:
-            return "Ran out of crossings to distinguish"
-        except Exception as e:
-            return e
+    def _setState(self, state):
+        self.state = state
+        self.ijkCrossings = CompactCrossings(state)
+        self.handedness = CompactHandedness(state)
+        self.arcEnds = CompactArcEnds(state)
+        self._clearPaths()
+
+    def _addEnd(self, arc, c, myDir):
+        mv, row = self.state.mv, self.state.n + arc
+        for e in range(MAX_ARC_ENDS):
+            if mv[row, e] < 0:
+                mv[row, e] = c * 4 + DIR_COLS[myDir]
+                return
+        raise ValueError("arc {} is attached in too many places".format(arc))
+
+    def _dropEnd(self, arc, c, myDir):
+        mv, row, end = self.state.mv, self.state.n + arc, c * 4 + DIR_COLS[myDir]
+        for e in range(MAX_ARC_ENDS):
+            if mv[row, e] == end:
+                mv[row, e] = -1
+                return
+        raise ValueError("arc {} isn't attached to {} at {}".format(arc, myDir, c))
+
+    def duplicate(self, name=None):
+        knot = CompactKnot.__new__(CompactKnot)
+        knot.numUnknots = self.numUnknots
+        knot.name = self.name if name is None else name
+        knot._setState(self.state.copy())
+        knot.knotPaths, knot.crossingPathInds = self.knotPaths, self.crossingPathInds
+        return knot
+
+    def toCompact(self, name=None):
+        return self.duplicate(name)
 
 
 if __name__ == "__main__":
@@ -6,43 +6,62 @@ from math import sin, cos, radians
 from random import randint
 from LineFinder import *
 from KnotHandler import *
+import numpy as np
 from skimage import io, color, morphology, img_as_float, img_as_uint
 from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QGridLayout, QWidget
-from PyQt5.QtGui import QPixmap, QPainter, QColor, QFont, QPen
+from PyQt5.QtGui import QPixmap, QImage, QPainter, QColor, QFont, QPen
 from PyQt5.QtCore import Qt, QTimer, QCoreApplication
 
 QApplication.setAttribute(Qt.AA_EnableHighDpiScaling, True)
 
+# wrap a uint8 image array (grayscale, rgb or rgba) in a QImage that shares
+# its memory. the array has to outlive the QImage
+def toQImage(array):
+    height, width = array.shape[0:2]
+    if array.ndim == 2:
+        imgFormat = QImage.Format_Grayscale8
+    elif array.shape[2] == 3:
+        imgFormat = QImage.Format_RGB888
+    else:
+        imgFormat = QImage.Format_RGBA8888
+    return QImage(array.data, width, height, array.strides[0], imgFormat)
+
 class KnotCanvas(QWidget):
 
-    def __init__(self, givenFilePath, tickFPS):
+    # set saveSkeleton to also write the skeleton to skeletons/ next to the image
+    def __init__(self, givenFilePath, tickFPS, saveSkeleton=False):
         super().__init__()
 
         # extract file directory and path
         lastSlash = givenFilePath.rindex("/")
         fileName = givenFilePath[lastSlash+1:]
         knotsPath = givenFilePath[:lastSlash]
-        
-        skelFolder = "{}/skeletons/".format(knotsPath)
-        if not os.path.exists(skelFolder): # create if doesn't exist
-            os.makedirs(skelFolder)
-        self.skelFilePath = "{}/skeletons/skeleton_{}.png".format(knotsPath, fileName)
         self.filePath = "{}/{}".format(knotsPath, fileName)
 
-        # skeletonize image
-        image = img_as_float(color.rgb2gray(io.imread(self.filePath)))
-        image_binary = image < 0.5
-        self.skelImageData = morphology.skeletonize(image_binary)
-        io.imsave(self.skelFilePath, img_as_uint(self.skelImageData)) # TODO: delete when done
+        # read the image once and skeletonize it in memory
+        self.imageData = io.imread(self.filePath) # get image data with sci-kit
+        self.skelImageData = itools.skeletonizeImage(self.imageData)
+
+        if saveSkeleton:
+            skelFolder = "{}/skeletons/".format(knotsPath)
+            if not os.path.exists(skelFolder): # create if doesn't exist
+                os.makedirs(skelFolder)
+            skelFilePath = "{}/skeletons/skeleton_{}.png".format(knotsPath, fileName)
+            io.imsave(skelFilePath, img_as_uint(self.skelImageData))
 
         # declare class variables
-        self.imageData = io.imread(self.filePath) # get image data with sci-kit
         QCoreApplication.quit()
         self.kh = KnotHandler(self.imageData, self.skelImageData, self.swapImage, fileName, QCoreApplication.quit)
 
+        # qt views of the image arrays (the arrays must stay alive with them)
+        self.normalArray = np.ascontiguousarray(self.imageData, dtype=np.uint8)
+        self.skelArray = np.ascontiguousarray(self.skelImageData, dtype=np.uint8) * 255
+        self.normalImage = toQImage(self.normalArray)
+        self.skelImage = toQImage(self.skelArray)
+
         # add image background
-        self.normalPixmap = QPixmap(self.filePath)
-        self.skelPixmap = QPixmap(self.skelFilePath)
+        self.normalPixmap = QPixmap.fromImage(self.normalImage)
+        self.skelPixmap = QPixmap.fromImage(self.skelImage)
         self.activeImg = 'normal'
         self.label = QLabel()
         self.label.setPixmap(self.normalPixmap)
@@ -76,8 +95,9 @@ class KnotCanvas(QWidget):
 
     # boilerplate to handle frame-by-frame updates
     def paintEvent(self, event):
-        self.normalPixmap = QPixmap(self.filePath)
-        self.skelPixmap = QPixmap(self.skelFilePath)
+        # start each frame from a clean copy of the image
+        self.normalPixmap = QPixmap.fromImage(self.normalImage)
+        self.skelPixmap = QPixmap.fromImage(self.skelImage)
         self.label.setPixmap(self.normalPixmap if self.activeImg == 'normal' else self.skelPixmap)
 
         qp = QPainter() # start painting
@@ -92,11 +112,11 @@ class KnotCanvas(QWidget):
     def draw(self, qp):
         self.kh.draw(qp) # draw stuff
 
-def main(filePath=None): # ignore already declared error
+def main(filePath=None, saveSkeleton=False): # ignore already declared error
     if filePath == None:
         filePath = 'local_knot_data/5_1.png'
     app = QApplication(sys.argv)
-    ex = KnotCanvas(filePath, 10)
+    ex = KnotCanvas(filePath, 10, saveSkeleton)
 
     # sys.exit(app.exec_())
     app.exec_()
@@ -8,24 +8,37 @@ import AlexPolyTools as APolTools
 
 from ArcHandler import *
 from Knot import Knot
-from PyQt5.QtGui import QPainter, QColor, QPen
-from PyQt5.QtCore import Qt, QTimer
 from colour import Color
+from skimage import measure
+from scipy import ndimage
+from scipy.sparse import csgraph
+import numpy as np
+import heapq
 import json
 
-from PyQt5.QtWidgets import QApplication
-
+ARC_SEGMENTATION = True # label all arcs at once instead of searching/expanding
 ARC_SEARCH_SHORTCUT = True
 ARC_EXPAND_SHORTCUT = True
+SPINE_EXTRACTION = True # order all spines at once instead of searching/mapping
 SPINE_SEARCH_SHORTCUT = True
 SPINE_MAP_SHORTCUT = True
 SPINE_EXTENSION_SHORTCUT = True
 
+ARRAY_STORAGE = True # keep arc/spine membership in label images, not dicts
+
+ANALYTIC_PAIRING = True # pair all endpoints at once instead of stepping the extensions
+
 EXTENSION_RADIUS = 5 # radius of rectangle that extends out of spine_end
 
+# getRectangle truncates its corners to whole pixels, so a strip's pixels can
+# sit up to about a pixel diagonal further out than EXTENSION_RADIUS
+EXTENSION_SLACK = sqrt(2)
+
 class KnotHandler(): # TODO: delete self variables for certain steps once they're done
     
-    def __init__(self, imageData, skelImageData, swapImgFunc, imageName, kill):
+    # pass headless=True to stop once the crossings are found (no HOMFLY, no Qt)
+    def __init__(self, imageData, skelImageData, swapImgFunc=None, imageName="",
+            kill=None, headless=False):
         
         # image data
         self.imageData = imageData
@@ -37,20 +50,34 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
         # callback to swap image being displayed from normal to skeleton
         self.swapImgFunc = swapImgFunc
 
+        # callback to shut the gui down once we're done
+        self.kill = kill
+        self.headless = headless
+
         # instance variables
         self.status = None
-        self.ah = ArcHandler()
+        self.ah = ArcHandler(imageData.shape[0:2] if ARRAY_STORAGE else None)
 
         # declare for persistence purposes
         self.arcsCompletedInArcExpansion = []
         self.arcsCompletedInSpineMapping = []
         self.currArcInExpansion = 0
+        self.boundaryMask = None # computed on first use
+        self.arcLabels = None # arc label image (0 is background, arc n is n+1)
 
     # figure out what to do, status should ONLY be set in this function
     def computeTick(self):
 
         # start-up
-        if self.status is None:
+        if self.status is None and ARC_SEGMENTATION:
+            self.status = "arc-segment"
+            print(self.status)
+
+        # all arcs were labeled in one go
+        elif self.status == "arc-segment":
+            self.startSpineSearch()
+
+        elif self.status is None:
             self.status = "arc-search"
             allPixels = [(col, row) for row in range(0, self.imageHeight)
                     for col in range(0, self.imageWidth)]
@@ -74,13 +101,7 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
             # check if we're at the last pixel
             if self.currPixelInArcSearch[0] == self.imageWidth-1 and self.currPixelInArcSearch[1] == self.imageHeight - 1:
                 print('Hit last pixel')
-                self.status = "spine-search"
-                print(self.status)
-                self.swapImgFunc() # show skeleton image
-                allPixels = [(col, row) for row in range(0, self.imageHeight)
-                    for col in range(0, self.imageWidth)]
-                self.pixelIterSpineSearch = iter(allPixels)
-                self.currPixelInSpineSearch = None # don't iter until performTick()
+                self.startSpineSearch()
 
         # see if we're done expanding in this arc
         elif self.status == "arc-expand":
@@ -99,7 +120,7 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
             # TODO currPix = self.currPixelInArcSearch
             if self.pixelIsSpine(self.currPixelInSpineSearch):
                 # doesn't belong to a spine yet and hasn't been snipped from one 
-                if not self.ah.pixelHasSpine(self.currPixelInArcSearch) \
+                if not self.ah.pixelHasSpine(self.currPixelInSpineSearch) \
                         and self.currPixelInSpineSearch not in self.ah.snippedSpinePixs:
                     self.status = "spine-map"
                     self.currArcInSpineMap = self.ah.getPixelArc(self.currPixelInSpineSearch)
@@ -111,26 +132,11 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
             # check if we're at the last pixel
             if self.currPixelInSpineSearch[0] == self.imageWidth-1 and self.currPixelInSpineSearch[1] == self.imageHeight - 1:
                 print('Hit last pixel')
-                self.status = "spine-extension"
-                print(self.status)
-                # get paths for all endpoints (make path maximum possible diagonal)
-                paths = []
-                pathLength = sqrt(self.imageHeight**2 + self.imageWidth **2)
-                for arcNum in range(0, self.ah.numArcsInitialized()):
-                    paths.extend(self.ah.getPathsForSpineExtension(arcNum, pathLength))
-                self.spineExtensionPaths = dict() # endPoint => path excluding endpoint
-                self.spineExtensionStepped = dict() # endPoint => steps completed on path
-                for path in paths:
-                    endPoint = path[0]
-                    self.spineExtensionPaths[endPoint] = []
-                    self.spineExtensionStepped[endPoint] = []
-                    for pixel in path:
-                        # make sure pixel' in-bounds and exclude the endPoint
-                        if self.pixelInBounds(pixel) and pixel != endPoint:
-                            self.spineExtensionPaths[endPoint].append(pixel)
-
-            # map each path pixel to the endpoint and arc to which it belongs
-            self.spineExtensionPixelsToArc = dict() # extension pixel => set(endPoint, endPoint, ...)
+                self.startSpineExtension()
+
+        # all spines were extracted in one go
+        elif self.status == "spine-extract":
+            self.startSpineExtension()
         
         elif self.status == "spine-extension":
             # test to see if all endPoints have intersected; if so, we're done
@@ -151,12 +157,19 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
                 handedness = self.ah.handedness
                 ijkCrossingNs = self.ah.ijkCrossingNs
 
-                # error check
+                # error check. library callers would otherwise get the bad
+                # handedness back from runToCompletion
                 if any([h != "left" and h != "right" for h in handedness]):
+                    if self.headless:
+                        raise ValueError("Error: Handedness had an unrecognized value: {}".format(handedness))
                     print("Error: Handedness had an unrecognized value")
                     print(handedness)
                     return
 
+                # library callers only want the crossings
+                if self.headless:
+                    return
+
                 print("IJK Crossings:")
                 for ind, c in enumerate(ijkCrossings):
                     print("{}: {}".format(ind, c))
@@ -181,7 +194,8 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
                     f.write("{},{}\n".format(self.imageName, homflyPoly))
                 print(homflyPoly)
 
-                QApplication.quit()
+                if self.kill is not None:
+                    self.kill()
 
                 # sys.exit()
 
@@ -222,12 +236,57 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
                 # currArcInSpineMap comes from when we find a pixel that has a
                 # spine, so no need to increment it
 
+    # switch over to searching the skeleton for spines
+    def startSpineSearch(self):
+        self.status = "spine-extract" if SPINE_EXTRACTION else "spine-search"
+        print(self.status)
+        if self.swapImgFunc is not None:
+            self.swapImgFunc() # show skeleton image
+        if SPINE_EXTRACTION:
+            return
+        allPixels = [(col, row) for row in range(0, self.imageHeight)
+            for col in range(0, self.imageWidth)]
+        self.pixelIterSpineSearch = iter(allPixels)
+        self.currPixelInSpineSearch = None # don't iter until performTick()
+
+    # switch over to extending lines out of every spine endpoint
+    def startSpineExtension(self):
+        self.status = "spine-extension"
+        print(self.status)
+        # get paths for all endpoints (make path maximum possible diagonal)
+        paths = []
+        pathLength = sqrt(self.imageHeight**2 + self.imageWidth **2)
+        for arcNum in range(0, self.ah.numArcsInitialized()):
+            paths.extend(self.ah.getPathsForSpineExtension(arcNum, pathLength))
+        self.spineExtensionPaths = dict() # endPoint => path excluding endpoint
+        self.spineExtensionStepped = dict() # endPoint => steps completed on path
+        for path in paths:
+            endPoint = path[0]
+            self.spineExtensionPaths[endPoint] = []
+            self.spineExtensionStepped[endPoint] = []
+            for pixel in path:
+                # make sure pixel' in-bounds and exclude the endPoint
+                if self.pixelInBounds(pixel) and pixel != endPoint:
+                    self.spineExtensionPaths[endPoint].append(pixel)
+
+        # map each path pixel to the endpoint and arc to which it belongs
+        self.spineExtensionPixelsToArc = dict() # extension pixel => set(endPoint, endPoint, ...)
+        self.spineExtensionPaired = False # whether pairEndPoints has had its go
+
     # do the stuff that we determined we need to do
     def performTick(self):
 
         if self.status == "done":
             pass
 
+        # label every arc in the image at once
+        elif self.status == "arc-segment":
+            self.segmentArcs()
+
+        # order every spine in the skeleton at once
+        elif self.status == "spine-extract":
+            self.extractSpines()
+
         # move our cursor in the search for arcs
         elif self.status == "arc-search":
             if ARC_SEARCH_SHORTCUT: # cheat and jump until we hit the end or a new arc
@@ -272,12 +331,21 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
                 except StopIteration:
                     print("Error: We finished iteration in performTick...")
         
+        # pair what we can at once, anything left over is stepped below
+        elif self.status == "spine-extension" and ANALYTIC_PAIRING and not self.spineExtensionPaired:
+            self.pairEndPoints()
+            self.spineExtensionPaired = True
+
         # take one step in all paths
         elif self.status == "spine-extension":
 
-            # take the next step for all paths that haven't intersected yet
+            # take the next step for all paths that haven't intersected yet.
+            # a path that has run out stays where it is for others to hit
+            stepped = False
             for endPoint, path in self.spineExtensionPaths.items():
-                if self.ah.getEndPointPair(endPoint) is None: # not connected
+                if self.ah.getEndPointPair(endPoint) is None and path: # not connected
+                    stepped = True
+
                     # pop the step off
                     nextStep = path.pop(0)
 
@@ -294,6 +362,9 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
                         else:
                             self.spineExtensionPixelsToArc[pixel] = set([endPoint])
 
+            if not stepped and not self.ah.allEndpointsConnected():
+                raise Exception("Error: Not every extension line collided with another.")
+
         
         # take a step in BFS arc expansion
         elif self.status == "arc-expand":
@@ -418,8 +489,20 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
             else:
                 spineMapStep()
 
+    # run every stage back to back without waiting on a timer or repainting
+    # returns ijkCrossings, handedness, ijkCrossingNs. raises ValueError if the
+    # crossings' handedness couldn't be worked out
+    def runToCompletion(self):
+        while self.status != "done":
+            self.computeTick()
+            self.performTick()
+        return self.ah.ijkCrossings, self.ah.handedness, self.ah.ijkCrossingNs
+
     # draws whatever's necessary when it's time to draw
     def draw(self, qp):
+        from PyQt5.QtGui import QColor, QPen # only the gui needs qt
+        from PyQt5.QtCore import Qt
+
         pen = QPen(Qt.black, 1, Qt.SolidLine)
         qp.setPen(pen)
 
@@ -522,6 +605,176 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
             #         qp.drawPoint(pixel[0], pixel[1])
 
 
+    # connect every endpoint in one go. instead of stepping each extension path
+    # a pixel per tick, figure out for every pair of endpoints the first tick
+    # their strips could touch (the two center segments get within two radii
+    # plus slack of each other), then go through those ticks in order checking
+    # the same getRectangle strips the stepping uses, connecting a pair once
+    # they share a pixel and skipping endpoints that are already taken.
+    # endpoints left over are paired by the stepping extension afterwards
+    def pairEndPoints(self):
+        endPoints = [ep for ep, path in self.spineExtensionPaths.items() if path]
+        numEps = len(endPoints)
+        if numEps < 2:
+            return
+
+        # pad the paths so tick t of endpoint e is paths[e, t - 1]
+        pathLens = np.array([len(self.spineExtensionPaths[ep]) for ep in endPoints])
+        maxLen = pathLens.max()
+        paths = np.zeros((numEps, maxLen, 2), dtype=np.float64)
+        for e, ep in enumerate(endPoints):
+            path = np.array(self.spineExtensionPaths[ep], dtype=np.float64)
+            paths[e, :len(path)] = path
+            paths[e, len(path):] = path[-1] # stays put once out of path
+        starts = np.array(endPoints, dtype=np.float64)
+
+        # every pair of endpoints
+        a, b = np.triu_indices(numEps, k=1)
+        reach = 2 * (EXTENSION_RADIUS + EXTENSION_SLACK)
+
+        # returns which pairs' strips might touch by the given ticks
+        def touching(ticks):
+            return itools.segmentDistances(
+                starts[a], paths[a, ticks - 1], starts[b], paths[b, ticks - 1]) <= reach
+
+        # binary search for the first tick each pair might touch at
+        lo = np.ones(len(a), dtype=np.int64)
+        hi = np.full(len(a), maxLen, dtype=np.int64)
+        collide = touching(hi)
+        while np.any(lo < hi):
+            mid = (lo + hi) // 2
+            midTouching = touching(mid)
+            hi = np.where(midTouching, mid, hi)
+            lo = np.where(midTouching, lo, mid + 1)
+
+        # the pixels an endpoint's extension has covered by some tick, drawn
+        # as they're needed. like the stepping this is every strip so far, the
+        # rounding on an early one can be what touches
+        candidates = [(int(lo[pair]), int(pair)) for pair in np.nonzero(collide)[0]]
+        stepped = dict() # endpoint index => [last tick drawn, pixels]
+
+        def getStepped(e, tick):
+            lastTick, pixels = stepped.setdefault(e, [0, set()])
+            for t in range(lastTick + 1, tick + 1):
+                nextStep = tuple(int(v) for v in paths[e, t - 1])
+                pixels |= itools.getRectangle(endPoints[e], nextStep, EXTENSION_RADIUS)
+            stepped[e][0] = max(lastTick, tick)
+            return pixels
+
+        # check the pairs tick by tick from their first possible collision on
+        heapq.heapify(candidates)
+        while candidates and not self.ah.allEndpointsConnected():
+            tick, pair = heapq.heappop(candidates)
+            ep1, ep2 = endPoints[a[pair]], endPoints[b[pair]]
+            if self.ah.getEndPointPair(ep1) is not None or self.ah.getEndPointPair(ep2) is not None:
+                continue
+            if getStepped(a[pair], tick) & getStepped(b[pair], tick):
+                print("Extension lines collide after {} steps. Endpoints: {}".format(tick, [ep1, ep2]))
+                self.ah.connectEndPointToEndPoint(ep1, ep2)
+            elif tick < maxLen:
+                heapq.heappush(candidates, (tick + 1, pair))
+
+        if not self.ah.allEndpointsConnected():
+            print("Not every extension line collided with another, stepping the rest")
+
+    # label all 8-connected arcs of the image in one pass. arcs are numbered in
+    # the same (row by row) order that arc-search would have found them in
+    def segmentArcs(self):
+        labels, numArcs = measure.label(self.getArcMask(), connectivity=2,
+            background=0, return_num=True)
+        self.ah.addArcsFromLabels(labels, numArcs, self.getBoundaryMask())
+        self.arcLabels = labels
+
+        # mark everything as expanded so it gets drawn
+        self.arcsCompletedInArcExpansion = list(range(numArcs))
+        self.currArcInExpansion = numArcs
+        for arcNum in self.arcsCompletedInArcExpansion:
+            print(" - Arc {} has {} pixels.".format(arcNum, len(self.ah.getArcPixels(arcNum))))
+        print(" - Total pixels mapped to an arc: {}".format(len(self.ah.getPixelMappings())))
+
+    # turn the skeleton into one ordered line of pixels per arc. endpoints and
+    # joints come from counting neighbors over the whole skeleton at once, and
+    # each spine is the longest path through its arc's part of the skeleton;
+    # whatever's left over (spurs, knubs) is snipped
+    def extractSpines(self):
+        labels = self.getArcLabels()
+        skel = np.asarray(self.skelImageData, dtype=bool) & (labels > 0)
+        neighborCounts = itools.countNeighbors(skel)
+        rows, cols = np.nonzero(skel)
+        pixelArcNums = labels[rows, cols] - 1
+        isEndPoint = neighborCounts[rows, cols] == 1
+        isJoint = neighborCounts[rows, cols] > 2
+
+        # connect spine pixels that are neighbors within the same arc
+        graph = itools.getPixelGraph(skel, labels)
+
+        numArcs = self.ah.numArcsInitialized()
+        for arcNum in range(numArcs):
+            nodes = np.nonzero(pixelArcNums == arcNum)[0]
+            if len(nodes) == 0:
+                print("Warning: Arc {} has no spine".format(arcNum))
+                continue
+            endNodes = nodes[isEndPoint[nodes]]
+            if len(endNodes) == 0:
+                print("Warning: Arc {} has no spine endpoints".format(arcNum))
+                continue
+            numJoints = np.count_nonzero(isJoint[nodes])
+            if numJoints > 0:
+                print("Warning: Arc {} has {} pixels with more than two neighbors"
+                    .format(arcNum, numJoints))
+
+            # longest path: farthest pixel from any endpoint, then farthest from that
+            order = csgraph.breadth_first_order(graph, endNodes[0], directed=False,
+                return_predecessors=False)
+            head = order[-1]
+            order, preds = csgraph.breadth_first_order(graph, head, directed=False)
+            tail = order[-1]
+            pathNodes = [tail]
+            while pathNodes[-1] != head:
+                pathNodes.append(preds[pathNodes[-1]])
+            pathNodes = np.array(pathNodes)
+            path = np.stack([cols[pathNodes], rows[pathNodes]], axis=1)
+
+            # orient like spine-map would have: "next" leaves the first pixel in
+            # row order towards its first neighbor in row order
+            first = np.lexsort((path[:, 0], path[:, 1]))[0]
+            if first == len(path) - 1:
+                path = path[::-1]
+            elif first > 0:
+                before, after = path[first - 1], path[first + 1]
+                if (before[1], before[0]) < (after[1], after[0]):
+                    path = path[::-1]
+
+            # anything in the arc that didn't make it onto the path is snipped
+            snipped = np.setdiff1d(nodes, pathNodes)
+            self.ah.snippedSpinePixs.update(zip(cols[snipped].tolist(), rows[snipped].tolist()))
+
+            self.ah.setSpinePath(arcNum, np.ascontiguousarray(path))
+            self.arcsCompletedInSpineMapping.append(arcNum)
+            print('Completed spine {} ({} pixels, {} snipped)'.format(arcNum, len(path), len(snipped)))
+
+    # arc label image (0 is background, arc n is n+1), built from ArcHandler
+    # if the arcs weren't segmented in one go
+    def getArcLabels(self):
+        if self.arcLabels is None:
+            self.arcLabels = np.zeros((self.imageHeight, self.imageWidth), dtype=np.int32)
+            for (col, row), arcNum in self.ah.getPixelMappings().items():
+                self.arcLabels[row, col] = arcNum + 1
+        return self.arcLabels
+
+    # boolean image of every pixel that isn't white
+    def getArcMask(self):
+        return np.any(self.imageData[:, :, 0:3] != 255, axis=2) # ommit alpha channel
+
+    # boolean image of every arc pixel that touches a white pixel: the arc mask
+    # minus its erosion. outside the image doesn't count as white
+    def getBoundaryMask(self):
+        if self.boundaryMask is None:
+            arcMask = self.getArcMask()
+            eroded = ndimage.binary_erosion(arcMask, structure=np.ones((3, 3)), border_value=1)
+            self.boundaryMask = arcMask & ~eroded
+        return self.boundaryMask
+
     def pixelIsArc(self, pixel):
         row = pixel[1]
         col = pixel[0]
@@ -557,13 +810,18 @@ class KnotHandler(): # TODO: delete self variables for certain steps once they'r
 
     # determine if a given arc pixel is a boundary of the arc
     def isBoundaryPixel(self, pixel):
-        neighbors = self.getNeighbors(pixel)
-        neighborColors = []
-        for n in neighbors:
-            row = n[1]
-            col = n[0]
-            neighborColors.append(tuple(self.imageData[row][col][0:3])) # ommit alpha channel
-        return any([color == (255,255,255) for color in neighborColors])
+        row = pixel[1]
+        col = pixel[0]
+        return bool(self.getBoundaryMask()[row, col])
+
+
+# analyze an image array without a gui, returns ijkCrossings, handedness and
+# ijkCrossingNs. the skeleton is computed if one isn't given
+def analyzeImage(imageData, skelImageData=None, imageName=""):
+    if skelImageData is None:
+        skelImageData = itools.skeletonizeImage(imageData)
+    kh = KnotHandler(imageData, skelImageData, imageName=imageName, headless=True)
+    return kh.runToCompletion()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+from sympy import symbols, sympify
+from LaurentPoly import LaurentPoly
+import pickle
+import os
+
+# look up knots by their HOMFLY polynomial. homfly_polys.csv (from KnotInfo)
+# uses the v, z convention v^-1 P+ - v P- = z P0, while Knot uses
+# l P+ + l^-1 P- + m P0 = 0, so every row is moved over with v = i/l, z = i*m.
+# parsing the csv takes a while, so the finished index is pickled next to it
+# and only rebuilt when the csv changes. nothing is read until the first lookup
+
+# both live next to this file, wherever it's run from
+HOMFLY_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "homfly_polys.csv")
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "homfly_index.pickle")
+INDEX_VERSION = 1
+
+MIRROR_FORMAT = "{} (mirror)"
+
+_index = None # normalized polynomial => [knot names], loaded on first use
+
+
+# a hashable form of a LaurentPoly in l and m
+def getKey(poly):
+    return tuple(sorted(poly.terms.items()))
+
+
+# move a LaurentPoly in v and z over to l and m
+def vzToLM(poly):
+    terms = dict()
+    for (vPow, zPow), coeff in poly.terms.items():
+        # v^a z^b = i^(a + b) l^-a m^b, real since a and b share parity for knots
+        if (vPow + zPow) % 2 != 0:
+            raise ValueError("Term v^{} z^{} has no real l, m form".format(vPow, zPow))
+        sign = -1 if ((vPow + zPow) // 2) % 2 else 1
+        terms[(-vPow, zPow)] = terms.get((-vPow, zPow), 0) + sign * coeff
+    return LaurentPoly(terms)
+
+
+# the mirror image swaps P+ and P-, which is l => l^-1
+def mirror(poly):
+    return LaurentPoly({(-lPow, mPow): coeff for (lPow, mPow), coeff in poly.terms.items()})
+
+
+# parse homfly_polys.csv into an index
+def buildIndex(csvPath=HOMFLY_CSV):
+    v, z = symbols("v z")
+    index = dict()
+
+    def add(poly, name):
+        names = index.setdefault(getKey(poly), [])
+        if name not in names:
+            names.append(name)
+
+    with open(csvPath) as f:
+        next(f) # header
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            name, homfly = line.split(",", 1)
+            try:
+                poly = vzToLM(LaurentPoly.fromSympy(sympify(homfly.replace("^", "**")), v, z))
+            except Exception as e:
+                print("Skipping {}: {}".format(name, e))
+                continue
+            add(poly, name)
+            mirrored = mirror(poly)
+            if mirrored != poly: # amphichiral knots are their own mirror
+                add(mirrored, MIRROR_FORMAT.format(name))
+    return index
+
+
+# load the index from disk, or build it from the csv if that's out of date
+def loadIndex(csvPath=HOMFLY_CSV, indexPath=INDEX_FILE):
+    stat = os.stat(csvPath)
+    stamp = (INDEX_VERSION, stat.st_size, stat.st_mtime)
+    if os.path.exists(indexPath):
+        try:
+            with open(indexPath, 'rb') as f:
+                savedStamp, index = pickle.load(f)
+            if savedStamp == stamp:
+                return index
+        except Exception as e:
+            print("Couldn't read {}, rebuilding: {}".format(indexPath, e))
+
+    index = buildIndex(csvPath)
+    try:
+        with open(indexPath, 'wb') as f:
+            pickle.dump((stamp, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print("Couldn't save {}: {}".format(indexPath, e))
+    return index
+
+
+def getIndex():
+    global _index
+    if _index is None:
+        _index = loadIndex()
+    return _index
+
+
+# knot names whose HOMFLY polynomial matches, given a LaurentPoly or a sympy
+# expression in l and m (what Knot.computeHomfly returns)
+def identify(homfly):
+    if not isinstance(homfly, LaurentPoly):
+        homfly = LaurentPoly.fromSympy(homfly, *symbols("l m"))
+    return list(getIndex().get(getKey(homfly), []))
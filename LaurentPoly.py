@@ -0,0 +1,152 @@
+from sympy import symbols, expand
+from sympy import latex as latexForm
+
+# a Laurent polynomial in l and m with integer coefficients, stored as
+# {(power of l, power of m): coefficient}. the skein recursion builds a lot of
+# these, so it's kept much lighter than a sympy expression: every operation
+# returns a new, already expanded polynomial and nothing is simplified later
+class LaurentPoly:
+    __slots__ = ('terms',)
+
+    def __init__(self, terms=None):
+        self.terms = {
+            powers: coeff for powers, coeff in (terms or {}).items() if coeff != 0
+        }
+
+    # coeff * l^lPow * m^mPow
+    @classmethod
+    def monomial(cls, coeff=1, lPow=0, mPow=0):
+        return cls({(lPow, mPow): coeff})
+
+    # turn an int into a constant polynomial, leave polynomials alone
+    @classmethod
+    def wrap(cls, other):
+        if isinstance(other, LaurentPoly):
+            return other
+        if isinstance(other, int):
+            return cls.monomial(other)
+        return NotImplemented
+
+    def isMonomial(self):
+        return len(self.terms) == 1
+
+    def __add__(self, other):
+        other = LaurentPoly.wrap(other)
+        if other is NotImplemented:
+            return other
+        terms = dict(self.terms)
+        for powers, coeff in other.terms.items():
+            terms[powers] = terms.get(powers, 0) + coeff
+        return LaurentPoly(terms)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return LaurentPoly({powers: -coeff for powers, coeff in self.terms.items()})
+
+    def __sub__(self, other):
+        other = LaurentPoly.wrap(other)
+        if other is NotImplemented:
+            return other
+        return self + -other
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __mul__(self, other):
+        other = LaurentPoly.wrap(other)
+        if other is NotImplemented:
+            return other
+        terms = dict()
+        for (l1, m1), c1 in self.terms.items():
+            for (l2, m2), c2 in other.terms.items():
+                powers = (l1 + l2, m1 + m2)
+                terms[powers] = terms.get(powers, 0) + c1 * c2
+        return LaurentPoly(terms)
+
+    __rmul__ = __mul__
+
+    # only monomials of coefficient +-1 can be inverted without leaving the ring
+    def inverse(self):
+        if not self.isMonomial():
+            raise ValueError("Can't invert {}, not a monomial".format(self))
+        ((lPow, mPow), coeff), = self.terms.items()
+        if coeff not in [1, -1]:
+            raise ValueError("Can't invert {}, coefficient isn't +-1".format(self))
+        return LaurentPoly.monomial(coeff, -lPow, -mPow)
+
+    def __truediv__(self, other):
+        other = LaurentPoly.wrap(other)
+        if other is NotImplemented:
+            return other
+        return self * other.inverse()
+
+    def __pow__(self, n):
+        if not isinstance(n, int):
+            return NotImplemented
+        base = self if n >= 0 else self.inverse()
+        result = LaurentPoly.monomial(1)
+        for _ in range(abs(n)):
+            result = result * base
+        return result
+
+    def __eq__(self, other):
+        other = LaurentPoly.wrap(other)
+        if other is NotImplemented:
+            return False
+        return self.terms == other.terms
+
+    def __hash__(self):
+        return hash(frozenset(self.terms.items()))
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def __repr__(self):
+        return "LaurentPoly({})".format(self.terms)
+
+    def __str__(self):
+        if not self.terms:
+            return "0"
+        s = ""
+        for (lPow, mPow), coeff in sorted(self.terms.items(), reverse=True):
+            factors = [
+                "{}**{}".format(var, p) if p != 1 else var
+                for var, p in [('l', lPow), ('m', mPow)] if p != 0
+            ]
+            if abs(coeff) != 1 or not factors:
+                factors.insert(0, str(abs(coeff)))
+            sign = "-" if coeff < 0 else "+"
+            if not s:
+                s = ("-" if coeff < 0 else "") + "*".join(factors)
+            else:
+                s += " {} {}".format(sign, "*".join(factors))
+        return s
+
+    # convert an expanded sympy expression in two symbols with integer
+    # coefficients, like the ones toSympy gives back
+    @classmethod
+    def fromSympy(cls, expr, l, m):
+        terms = dict()
+        for monomial, coeff in expand(expr).as_coefficients_dict().items():
+            if not coeff.is_integer:
+                raise ValueError("{} has a coefficient that isn't an integer".format(expr))
+            powers = monomial.as_powers_dict()
+            unknown = [sym for sym in monomial.free_symbols if sym not in [l, m]]
+            if unknown:
+                raise ValueError("{} isn't in {} and {}".format(expr, l, m))
+            key = (int(powers.get(l, 0)), int(powers.get(m, 0)))
+            terms[key] = terms.get(key, 0) + int(coeff)
+        return cls(terms)
+
+    # convert to a sympy expression, in the given symbols if there are any
+    def toSympy(self, l=None, m=None):
+        if l is None or m is None:
+            l, m = symbols("l m")
+        return sum(
+            [coeff * l**lPow * m**mPow for (lPow, mPow), coeff in self.terms.items()],
+            0
+        )
+
+    def toLatex(self, l=None, m=None):
+        return latexForm(self.toSympy(l, m))
@@ -0,0 +1,105 @@
+import time
+
+# tracing for the skein recursion in Knot. pass a SkeinTracer (or a level to
+# computeHomfly) to turn it on. with tracing off the recursion is handed None
+# and every call site is skipped behind an `if tracer`, so it costs nothing
+
+TRACE_OFF = 0
+TRACE_SUMMARY = 1 # only keep counts and timings, print the summary at the end
+TRACE_NODES = 2 # also record and print an event per skein node
+TRACE_FULL = 3 # also every R1 removal and the diagram at each node
+
+
+class SkeinTracer:
+    def __init__(self, level=TRACE_SUMMARY, out=print):
+        self.level = level
+        self.out = out # where event lines go
+        self.events = [] # dicts, recorded from TRACE_NODES up
+        self.numNodes = 0
+        self.maxDepth = 0
+        self.numR1Removals = 0
+        self.numR2Removals = 0
+        self.numR3Moves = 0
+        self.nodesPerDepth = dict() # depth => nodes entered
+        self.secsPerDepth = dict() # depth => time spent in nodes there (not below)
+        self.cache = None
+        self.startTime = time.time()
+        self.stack = [] # [start time, time spent in children] per open node
+
+    # record an event, printing it if we're verbose enough
+    def event(self, kind, level=TRACE_NODES, **fields):
+        if self.level < level:
+            return
+        fields['kind'] = kind
+        fields['time'] = time.time() - self.startTime
+        self.events.append(fields)
+        self.out("{:>9.4f}s {:<10} {}".format(
+            fields['time'], kind,
+            " ".join(
+                "{}={}".format(key, value) for key, value in fields.items()
+                if key not in ['kind', 'time']
+            )
+        ))
+
+    # a skein node was entered
+    def enter(self, name, depth, branch):
+        self.numNodes += 1
+        self.maxDepth = max(self.maxDepth, depth)
+        self.nodesPerDepth[depth] = self.nodesPerDepth.get(depth, 0) + 1
+        self.stack.append([time.time(), 0.0])
+        self.event("node", name=name, depth=depth, branch=branch)
+
+    # the node entered last is done
+    def exit(self, depth):
+        start, childSecs = self.stack.pop()
+        secs = time.time() - start
+        self.secsPerDepth[depth] = self.secsPerDepth.get(depth, 0.0) + secs - childSecs
+        if self.stack:
+            self.stack[-1][1] += secs
+
+    # a crossing was taken out by reduceR1s
+    def r1Removal(self, name, c, unknots):
+        self.numR1Removals += 1
+        self.event("r1-remove", level=TRACE_FULL, name=name, crossing=c, unknots=unknots)
+
+    # a bigon was taken out by Knot.simplify
+    def r2Removal(self, name, c1, c2, unknots):
+        self.numR2Removals += 1
+        self.event("r2-remove", level=TRACE_FULL, name=name, crossings=[c1, c2], unknots=unknots)
+
+    # Knot.simplify moved a strand across a triangle
+    def r3Move(self, name, crossings):
+        self.numR3Moves += 1
+        self.event("r3-move", level=TRACE_FULL, name=name, crossings=crossings)
+
+    def getSummary(self):
+        summary = {
+            'nodes': self.numNodes,
+            'maxDepth': self.maxDepth,
+            'r1Removals': self.numR1Removals,
+            'r2Removals': self.numR2Removals,
+            'r3Moves': self.numR3Moves,
+            'secs': time.time() - self.startTime,
+            'nodesPerDepth': dict(sorted(self.nodesPerDepth.items())),
+            'secsPerDepth': dict(sorted(self.secsPerDepth.items())),
+        }
+        if self.cache is not None:
+            summary['cacheHits'] = self.cache.hits
+            summary['cacheMisses'] = self.cache.misses
+        return summary
+
+    def printSummary(self):
+        summary = self.getSummary()
+        self.out("---- Skein summary ----")
+        self.out("Nodes: {}, max depth: {}, R1/R2 removals: {}/{}, R3 moves: {}, total {:.4f}s".format(
+            summary['nodes'], summary['maxDepth'], summary['r1Removals'],
+            summary['r2Removals'], summary['r3Moves'], summary['secs']
+        ))
+        if 'cacheHits' in summary:
+            self.out("Cache: {} hits, {} misses".format(
+                summary['cacheHits'], summary['cacheMisses']
+            ))
+        for depth, secs in summary['secsPerDepth'].items():
+            self.out("  depth {:>3}: {:>6} nodes {:>10.4f}s".format(
+                depth, summary['nodesPerDepth'].get(depth, 0), secs
+            ))
@@ -0,0 +1,316 @@
+# Benchmarks for the image pipeline and the invariant engines. Times every
+# KnotHandler stage on a fixed set of images from filenames.txt and the
+# polynomial code on the fixed crossing tables below, then writes everything
+# to a json file so two runs can be compared with --compare.
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from skimage import io
+import ImageTools as itools
+import AlexPolyTools as APolTools
+import DiagramTools as dtools
+from KnotHandler import KnotHandler
+from Knot import Knot
+from testAll import KNOT_FOLDER
+
+BENCH_OUT = 'bench_results.json'
+NUM_IMAGES = 5 # images taken from the top of filenames.txt
+REPEATS = 5
+
+# scaling runs: diagrams from 3 crossings up in steps, and once an op takes
+# longer than budget / SCALING_GROWTH it is skipped for the bigger diagrams
+SCALING_MAX_CROSSINGS = 50
+SCALING_STEP = 5
+SCALING_BUDGET = 10.0 # secs
+SCALING_GROWTH = 10
+SCALING_SEED = 0
+
+# crossing tables from Knot.__main__
+BENCH_KNOTS = {
+    'trefoil': (
+        [
+            {'i0': 2, 'i1': 3, 'j': 5, 'k': 0},
+            {'i0': 0, 'i1': 1, 'j': 3, 'k': 4},
+            {'i0': 4, 'i1': 5, 'j': 1, 'k': 2},
+        ],
+        ['right', 'right', 'right']
+    ),
+    'figure-8': (
+        [
+            {'i0': 3, 'i1': 4, 'j': 6, 'k': 7},
+            {'i0': 5, 'i1': 6, 'j': 0, 'k': 1},
+            {'i0': 7, 'i1': 0, 'j': 2, 'k': 3},
+            {'i0': 1, 'i1': 2, 'j': 4, 'k': 5},
+        ],
+        ['left', 'right', 'left', 'right']
+    ),
+    'taurus-5': (
+        [
+            {'i0': 5, 'i1': 1, 'j': 0, 'k': 8},
+            {'i0': 6, 'i1': 3, 'j': 4, 'k': 9},
+            {'i0': 7, 'i1': 0, 'j': 2, 'k': 5},
+            {'i0': 8, 'i1': 4, 'j': 1, 'k': 6},
+            {'i0': 9, 'i1': 2, 'j': 3, 'k': 7}
+        ],
+        ['right', 'right', 'right', 'right', 'right']
+    ),
+    'taurus-7': (
+        [
+            {'i0': 7, 'i1': 1, 'j': 2, 'k': 11},
+            {'i0': 8, 'i1': 3, 'j': 0, 'k': 12},
+            {'i0': 9, 'i1': 6, 'j': 5, 'k': 13},
+            {'i0': 10, 'i1': 2, 'j': 4, 'k': 7},
+            {'i0': 11, 'i1': 0, 'j': 1, 'k': 8},
+            {'i0': 12, 'i1': 5, 'j': 3, 'k': 9},
+            {'i0': 13, 'i1': 4, 'j': 6, 'k': 10}
+        ],
+        ['right', 'right', 'right', 'right', 'right', 'right', 'right']
+    ),
+}
+
+
+# the pipeline and the engines print a lot, keep it out of the timings
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            yield
+
+
+# run func (on a fresh argument from setup, if given) `repeats` times and
+# return the timings along with the last result
+def timeIt(func, setup=None, repeats=REPEATS):
+    times = []
+    result = None
+    for _ in range(repeats):
+        arg = setup() if setup is not None else None
+        with quiet():
+            start = time.perf_counter()
+            result = func(arg) if setup is not None else func()
+            times.append(time.perf_counter() - start)
+    return times, result
+
+
+def makeRecord(group, name, op, times, **extra):
+    record = {
+        'group': group,
+        'name': name,
+        'op': op,
+        'best': min(times) if times else None,
+        'mean': sum(times) / len(times) if times else None,
+        'repeats': len(times),
+    }
+    record.update(extra)
+    return record
+
+
+# turn i0/i1/j/k crossings into the i/j/k form AlexPolyTools expects, where
+# arcs only end at undercrossings (i0 and i1 are the same arc there)
+def toImageForm(ijkCrossings):
+    parent = dict()
+
+    def find(arc):
+        while parent.setdefault(arc, arc) != arc:
+            arc = parent[arc]
+        return arc
+
+    for cData in ijkCrossings:
+        parent[find(cData['i0'])] = find(cData['i1'])
+    labels = dict()
+    for cData in ijkCrossings:
+        for arc in cData.values():
+            labels.setdefault(find(arc), len(labels))
+    return [
+        {'i': labels[find(cData['i0'])], 'j': labels[find(cData['j'])], 'k': labels[find(cData['k'])]}
+        for cData in ijkCrossings
+    ]
+
+
+# time each invariant on each fixed crossing table
+def benchKnots(repeats=REPEATS):
+    records = []
+    for name, (ijkCrossings, handedness) in BENCH_KNOTS.items():
+        def fresh():
+            return Knot([dict(cData) for cData in ijkCrossings], list(handedness))
+
+        ops = [
+            ('computeHomfly', lambda k: k.computeHomfly()),
+            ('computeHomfly-descending', lambda k: k.computeHomfly(strategy="descending")),
+            ('computeHomfly-braid', lambda k: k.computeHomfly(engine="braid")),
+            ('computeJones', lambda k: k.computeJones()),
+            ('reduceR1s', lambda k: k.reduceR1s()),
+            ('getKnotPaths', lambda k: k.getKnotPaths()),
+        ]
+        for op, func in ops:
+            times, result = timeIt(func, fresh, repeats)
+            records.append(makeRecord('knot', name, op, times, result=str(result)))
+
+        imageForm = toImageForm(ijkCrossings)
+        for op, func in [('AlexPolyTools.compute', APolTools.compute),
+                ('AlexPolyTools.computeFast', APolTools.computeFast)]:
+            times, result = timeIt(lambda: func(imageForm, handedness), repeats=repeats)
+            records.append(makeRecord('knot', name, op, times, result=str(result)))
+        print("{}: done".format(name))
+    return records
+
+
+# a generated diagram of each family with about numCrossings crossings
+def getScalingDiagrams(numCrossings, rng):
+    n = max(numCrossings, 3)
+    return [
+        ('twist', dtools.twist(n - 2)),
+        ('torus(2,q)', dtools.torus(2, n if n % 2 else n + 1)),
+        ('torus(3,q)', dtools.torus(3, n // 2 + (1 if (n // 2) % 3 == 0 else 0))),
+        ('random', dtools.randomDiagram(n, 3 if n % 2 == 0 else 4, rng=rng)),
+    ]
+
+
+# time each invariant on generated diagrams of growing size
+def benchScaling(maxCrossings=SCALING_MAX_CROSSINGS, step=SCALING_STEP,
+        budget=SCALING_BUDGET, seed=SCALING_SEED):
+    rng = random.Random(seed)
+    ops = [
+        ('computeHomfly', lambda k: k.computeHomfly()),
+        ('computeHomfly-descending', lambda k: k.computeHomfly(strategy="descending")),
+        ('computeHomfly-braid', lambda k: k.computeHomfly(engine="braid")),
+        ('computeJones', lambda k: k.computeJones()),
+    ]
+    records = []
+    tooSlow = set() # (family, op)
+    for numCrossings in [3] + list(range(step, maxCrossings + 1, step)):
+        for family, (ijkCrossings, handedness, numUnknots) in getScalingDiagrams(numCrossings, rng):
+            name = "{}-{}".format(family, len(ijkCrossings))
+            for op, func in ops:
+                if (family, op) in tooSlow:
+                    continue
+                times, result = timeIt(
+                    func, lambda: Knot([dict(cData) for cData in ijkCrossings], list(handedness), numUnknots), 1
+                )
+                records.append(makeRecord(
+                    'scaling', name, op, times, crossings=len(ijkCrossings), result=str(result)
+                ))
+                if times[0] > budget / SCALING_GROWTH:
+                    tooSlow.add((family, op))
+            print("{}: done".format(name))
+    return records
+
+
+# time reading, skeletonizing and every KnotHandler stage on each image
+def benchImages(fnames, folder=KNOT_FOLDER, repeats=REPEATS):
+    records = []
+    for fname in fnames:
+        filePath = "{}/{}".format(folder, fname)
+        if not os.path.exists(filePath):
+            print("{}: missing, skipped".format(filePath))
+            records.append(makeRecord('image', fname, 'missing', []))
+            continue
+
+        stageTimes = dict() # stage => [secs per repeat]
+        readTimes, skelTimes = [], []
+        error = None
+        for _ in range(repeats):
+            with quiet():
+                start = time.perf_counter()
+                imageData = io.imread(filePath)
+                readTimes.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                skelImageData = itools.skeletonizeImage(imageData)
+                skelTimes.append(time.perf_counter() - start)
+
+                kh = KnotHandler(imageData, skelImageData, imageName=fname, headless=True)
+                thisRun = dict()
+                try:
+                    while kh.status != "done":
+                        stage = str(kh.status)
+                        start = time.perf_counter()
+                        kh.computeTick()
+                        kh.performTick()
+                        thisRun[stage] = thisRun.get(stage, 0.0) + time.perf_counter() - start
+                except Exception as e:
+                    error = str(e)
+            for stage, secs in thisRun.items():
+                stageTimes.setdefault(stage, []).append(secs)
+            if error is not None:
+                break
+
+        records.append(makeRecord('image', fname, 'imread', readTimes))
+        records.append(makeRecord('image', fname, 'skeletonize', skelTimes))
+        for stage, times in stageTimes.items():
+            records.append(makeRecord('image', fname, 'stage:{}'.format(stage), times))
+        if error is not None:
+            records.append(makeRecord('image', fname, 'error', [], error=error))
+        print("{}: {}".format(fname, "done" if error is None else "error: " + error))
+    return records
+
+
+def getCommit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+# print how each op in `records` compares to the same op in an older results file
+def compare(records, oldFile):
+    with open(oldFile) as f:
+        old = {
+            (r['group'], r['name'], r['op']): r for r in json.load(f)['records']
+        }
+    print("{:<8} {:<16} {:<28} {:>10} {:>10} {:>8}".format(
+        'group', 'name', 'op', 'old', 'new', 'speedup'))
+    for r in records:
+        before = old.get((r['group'], r['name'], r['op']))
+        if before is None or not before['best'] or not r['best']:
+            continue
+        print("{:<8} {:<16} {:<28} {:>10.5f} {:>10.5f} {:>7.2f}x".format(
+            r['group'], r['name'], r['op'], before['best'], r['best'], before['best'] / r['best']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the image pipeline and the invariant engines")
+    parser.add_argument('--filenames', default='filenames.txt', help="file listing one image name per line")
+    parser.add_argument('--folder', default=KNOT_FOLDER, help="folder holding the images")
+    parser.add_argument('--images', type=int, default=NUM_IMAGES, help="number of images to time")
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="runs per measurement")
+    parser.add_argument('--out', default=BENCH_OUT, help="json file to write results to")
+    parser.add_argument('--compare', default=None, help="earlier results file to compare against")
+    parser.add_argument('--skip-images', action='store_true', help="only time the crossing tables")
+    parser.add_argument('--scaling', action='store_true', help="also time generated diagrams of growing size")
+    parser.add_argument('--max-crossings', type=int, default=SCALING_MAX_CROSSINGS,
+        help="largest generated diagram for --scaling")
+    parser.add_argument('--budget', type=float, default=SCALING_BUDGET,
+        help="rough secs an op may take on one generated diagram")
+    args = parser.parse_args()
+
+    records = benchKnots(args.repeats)
+    if not args.skip_images:
+        with open(args.filenames) as f:
+            fnames = [line.strip() for line in f if line.strip()][:args.images]
+        records += benchImages(fnames, args.folder, args.repeats)
+    if args.scaling:
+        records += benchScaling(args.max_crossings, budget=args.budget)
+
+    results = {
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'commit': getCommit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'repeats': args.repeats,
+        'records': records,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Wrote {} results to {}".format(len(records), args.out))
+
+    if args.compare is not None:
+        compare(records, args.compare)
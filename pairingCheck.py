@@ -0,0 +1,70 @@
+# Checks that the analytic endpoint pairing (KnotHandler.pairEndPoints) joins
+# the same spine endpoints as the tick-by-tick extension it replaces. Every
+# image is run headless both ways and the pairs passed to
+# connectEndPointToEndPoint are compared. trefoil_pairing.png is a 700px
+# trefoil whose extension strips only touch through getRectangle's rounding
+
+import argparse
+import contextlib
+import os
+import sys
+from skimage import io
+import ImageTools as itools
+import KnotHandler as khandler
+
+CHECK_IMAGES = ['trefoil_pairing.png']
+
+
+# run one image through the pipeline and return the endpoint pairs it
+# connected (as frozensets) and the error it stopped on, if any
+def getPairs(imageData, skelImageData, analytic):
+    khandler.ANALYTIC_PAIRING = analytic
+    kh = khandler.KnotHandler(imageData, skelImageData, headless=True)
+    pairs = set()
+    connect = kh.ah.connectEndPointToEndPoint
+
+    def record(ep1, ep2):
+        pairs.add(frozenset([ep1, ep2]))
+        return connect(ep1, ep2)
+
+    kh.ah.connectEndPointToEndPoint = record
+    error = None
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            try:
+                kh.runToCompletion()
+            except Exception as e:
+                error = str(e)
+    return pairs, error
+
+
+# returns whether both pairings agree on every image
+def checkPairing(filePaths):
+    analyticSetting = khandler.ANALYTIC_PAIRING
+    allSame = True
+    try:
+        for filePath in filePaths:
+            imageData = io.imread(filePath)
+            skelImageData = itools.skeletonizeImage(imageData)
+            analyticPairs, analyticError = getPairs(imageData, skelImageData, True)
+            steppedPairs, steppedError = getPairs(imageData, skelImageData, False)
+            same = analyticPairs == steppedPairs and analyticError == steppedError
+            allSame = allSame and same
+            print("{}: {} ({} analytic pairs, {} stepped pairs)".format(
+                filePath, "same" if same else "DIFFERENT", len(analyticPairs), len(steppedPairs)))
+            for name, pairs, error in [('analytic', analyticPairs, analyticError),
+                    ('stepped', steppedPairs, steppedError)]:
+                if not same:
+                    print(" - {}: {}".format(name, sorted(tuple(sorted(pair)) for pair in pairs)))
+                if error is not None:
+                    print(" - {} stopped on: {}".format(name, error))
+    finally:
+        khandler.ANALYTIC_PAIRING = analyticSetting
+    return allSame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare analytic and stepped endpoint pairing")
+    parser.add_argument('images', nargs='*', default=CHECK_IMAGES, help="knot images to check")
+    args = parser.parse_args()
+    sys.exit(0 if checkPairing(args.images) else 1)
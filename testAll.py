@@ -1,24 +1,217 @@
-from KnotCanvas import main
+# Batch runner: computes the HOMFLY polynomial for every knot in filenames.txt
+# over a pool of worker processes. Each knot gets one row in the output file
+# with its status and timings, and knots that already have a row are skipped
+# so that an interrupted run can simply be started again.
 
+import argparse
+import csv
+import os
+import sys
+import time
+from multiprocessing import Process, Pipe, cpu_count
+from skimage import io
+from sympy import latex as latexForm
+from KnotHandler import analyzeImage
+from Knot import Knot
+import KnotIndex
 
-# get the list of knots and their filenamese
-fnames = []
-with open('filenames.txt') as f:
-    for line in f:
-        fnames.append(line.strip())
+KNOT_FOLDER = 'local_knot_data/knotinfo'
+OUT_FILE = 'batch_out.csv'
+OUT_HEADER = ['name', 'status', 'homfly', 'matches', 'analyzeSecs', 'homflySecs', 'totalSecs']
+TIMEOUT = 600 # seconds a single knot is allowed to take
+DEPTH_LIM = 50
+STRATEGY = "descending" # how the skein picks crossings, see Knot.computeHomfly
 
-# limit test to a certain amount
-testLimit = 9000
-print("Calculating HOMFLY polynomial for {} knots".format(testLimit))
+# strings that computeHomfly returns in place of a polynomial
+HOMFLY_ERRORS = ["Recursion Error", "Ran out of crossings to distinguish", "Empty diagram"]
 
-# start with some knot
-knot = None
-startInd = 0 if knot is None else fnames.index('{}.png'.format(knot))
 
-for fname in fnames[startInd:startInd + testLimit]:
-    print('-----------------------------{}---------------------------'.format(fname))
+# runs in a worker process: analyze one image, compute its homfly and send
+# back (status, homfly, matches, analyzeSecs, homflySecs) through conn.
+# matches are the names in homfly_polys.csv with the same polynomial
+def runKnot(filePath, depthLim, strategy, conn):
+    # the pipeline prints a lot, don't pay for it in the batch
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            computeKnot(filePath, depthLim, strategy, conn)
+        finally:
+            sys.stdout = sys.__stdout__
+
+
+def computeKnot(filePath, depthLim, strategy, conn):
+    analyzeSecs, homflySecs = None, None
     try:
-        main('local_knot_data/knotinfo/{}'.format(fname))
+        start = time.time()
+        ijkCrossings, handedness, ijkCrossingNs = analyzeImage(io.imread(filePath))
+        analyzeSecs = time.time() - start
+        if ijkCrossings is None:
+            conn.send(("analyze-error", "", "", analyzeSecs, homflySecs))
+            return
+
+        start = time.time()
+        knot = Knot(ijkCrossings, handedness, ijkCrossingNs=ijkCrossingNs)
+        homfly = knot.computeHomfly(depthLim=depthLim, strategy=strategy)
+        homflySecs = time.time() - start
+        if isinstance(homfly, Exception) or homfly in HOMFLY_ERRORS:
+            conn.send(("homfly-error", str(homfly), "", analyzeSecs, homflySecs))
+        else:
+            conn.send(("ok", latexForm(homfly), getMatches(homfly), analyzeSecs, homflySecs))
     except Exception as e:
-        with open("homfly_out.csv", 'a+') as f:
-            f.write("{},{}\n".format(fname, e))
\ No newline at end of file
+        status = "analyze-error" if analyzeSecs is None else "homfly-error"
+        conn.send((status, str(e), "", analyzeSecs, homflySecs))
+
+
+# make sure rows appended to an existing outFile line up with its header. a
+# file from before some columns were added is rewritten with those columns
+# left empty, anything else is refused
+def checkHeader(outFile):
+    if not os.path.exists(outFile):
+        return
+    with open(outFile, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        rows = list(reader)
+    if header == OUT_HEADER or (header is None and not rows):
+        return
+    if header is None or not set(header) < set(OUT_HEADER):
+        raise ValueError("{} has header {}, expected {}".format(outFile, header, OUT_HEADER))
+    if any(len(row) != len(header) for row in rows):
+        raise ValueError("{} has rows that don't match its header {}".format(outFile, header))
+
+    print("Adding columns {} to {}".format([col for col in OUT_HEADER if col not in header], outFile))
+    tmpFile = outFile + ".tmp"
+    with open(tmpFile, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(OUT_HEADER)
+        for row in rows:
+            values = dict(zip(header, row))
+            writer.writerow([values.get(col, "") for col in OUT_HEADER])
+    os.replace(tmpFile, outFile)
+
+
+# names of the known knots with this polynomial, separated by spaces. a failed
+# lookup (e.g. no homfly_polys.csv) leaves them empty rather than losing the
+# polynomial
+def getMatches(homfly):
+    try:
+        return " ".join(KnotIndex.identify(homfly))
+    except Exception as e:
+        print("Couldn't look up knot: {}".format(e), file=sys.stderr)
+        return ""
+
+
+# returns the names of all knots that already have a row in outFile
+# if retry is set, only successful rows count as done
+def getFinished(outFile, retry=False):
+    finished = set()
+    if not os.path.exists(outFile):
+        return finished
+    with open(outFile, newline='') as f:
+        for row in csv.DictReader(f):
+            if not retry or row['status'] == "ok":
+                finished.add(row['name'])
+    return finished
+
+
+def formatSecs(secs):
+    return "" if secs is None else "{:.3f}".format(secs)
+
+
+# compute all given knots with at most `workers` processes running at once
+def runBatch(fnames, folder=KNOT_FOLDER, outFile=OUT_FILE, workers=None,
+        timeout=TIMEOUT, depthLim=DEPTH_LIM, retry=False, strategy=STRATEGY):
+    if workers is None:
+        workers = cpu_count()
+
+    # skip everything we already have a result for
+    checkHeader(outFile)
+    finished = getFinished(outFile, retry)
+    pending = [fname for fname in fnames if fname not in finished]
+    print("Calculating HOMFLY polynomial for {} knots ({} already done) on {} workers".format(
+        len(pending), len(fnames) - len(pending), workers))
+
+    newFile = not os.path.exists(outFile) or os.path.getsize(outFile) == 0
+    with open(outFile, 'a+', newline='') as f:
+        writer = csv.writer(f)
+        if newFile:
+            writer.writerow(OUT_HEADER)
+
+        # write a row as soon as a knot is done so progress survives a crash
+        def record(fname, status, homfly, matches, analyzeSecs, homflySecs, totalSecs):
+            writer.writerow([fname, status, homfly, matches, formatSecs(analyzeSecs),
+                formatSecs(homflySecs), formatSecs(totalSecs)])
+            f.flush()
+            print("{}: {} ({}s)".format(fname, status, formatSecs(totalSecs)))
+
+        running = dict() # fname => (process, connection, start time)
+        while pending or running:
+            # fill up any free workers
+            while pending and len(running) < workers:
+                fname = pending.pop(0)
+                parentConn, childConn = Pipe(duplex=False)
+                p = Process(target=runKnot,
+                    args=("{}/{}".format(folder, fname), depthLim, strategy, childConn))
+                p.start()
+                childConn.close()
+                running[fname] = (p, parentConn, time.time())
+
+            # check on the running knots. is_alive goes first: a worker can send
+            # its result and exit right after a poll, and this way anything it
+            # sent before exiting is seen by the poll instead of lost as a crash
+            for fname, (p, conn, start) in list(running.items()):
+                elapsed = time.time() - start
+                alive = p.is_alive()
+                if conn.poll():
+                    try:
+                        status, homfly, matches, analyzeSecs, homflySecs = conn.recv()
+                    except EOFError: # died without sending anything
+                        status, homfly, matches, analyzeSecs, homflySecs = "crashed", "", "", None, None
+                    record(fname, status, homfly, matches, analyzeSecs, homflySecs, elapsed)
+                elif not alive:
+                    record(fname, "crashed", "", "", None, None, elapsed)
+                elif elapsed > timeout:
+                    p.terminate()
+                    record(fname, "timeout", "", "", None, None, elapsed)
+                else:
+                    continue
+                p.join()
+                conn.close()
+                del running[fname]
+            time.sleep(0.05)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute HOMFLY polynomials for a corpus of knot images")
+    parser.add_argument('--filenames', default='filenames.txt', help="file listing one image name per line")
+    parser.add_argument('--folder', default=KNOT_FOLDER, help="folder holding the images")
+    parser.add_argument('--out', default=OUT_FILE, help="csv file to append results to")
+    parser.add_argument('--workers', type=int, default=None, help="number of processes (default: all cores)")
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help="seconds allowed per knot")
+    parser.add_argument('--depth-lim', type=int, default=DEPTH_LIM, help="recursion limit for HOMFLY")
+    parser.add_argument('--strategy', default=STRATEGY, choices=["lowest", "descending"],
+        help="which crossings the skein recursion switches")
+    parser.add_argument('--start', default=None, help="knot to start with, e.g. 5_1")
+    parser.add_argument('--limit', type=int, default=None, help="maximum number of knots to run")
+    parser.add_argument('--retry', action='store_true', help="rerun knots whose last result wasn't ok")
+    args = parser.parse_args()
+
+    # get the list of knots and their filenames
+    fnames = []
+    with open(args.filenames) as f:
+        for line in f:
+            if line.strip():
+                fnames.append(line.strip())
+
+    # optionally start with some knot and limit the amount
+    startInd = 0 if args.start is None else fnames.index('{}.png'.format(args.start))
+    endInd = len(fnames) if args.limit is None else startInd + args.limit
+
+    # build or load the polynomial index once here instead of in every worker
+    try:
+        KnotIndex.getIndex()
+    except Exception as e:
+        print("No knot index, the matches column will be empty: {}".format(e))
+
+    runBatch(fnames[startInd:endInd], args.folder, args.out, args.workers,
+        args.timeout, args.depth_lim, args.retry, args.strategy)